@@ -0,0 +1,80 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*- #
+#
+# startup.py
+# ----------
+#
+# Measures how long a bot takes to start up: constructing it, finishing its
+# first poll for mentions, and loading its followers/friends in the
+# background.
+#
+#     python benchmarks/startup.py path/to/mybot.py:MyBot [runs] [--fake FOLLOWERS]
+#
+# The bot talks to Twitter for real, but only reads: mentions are fetched and
+# not handled, and nothing is saved, so the bot picks them up as usual the
+# next time it runs. With --fake it talks to a twitterbot.fake.FakeAPI with
+# that many followers instead.
+
+from __future__ import division
+from __future__ import print_function
+
+import imp
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from twitterbot.fake import FakeAPI
+
+
+def with_fake_api(bot_class, followers):
+    """
+    Subclass a bot so it talks to a FakeAPI instead of Twitter.
+    """
+    class FakeBot(bot_class):
+        def bot_init(self):
+            bot_class.bot_init(self)
+            self.config['api'] = FakeAPI(followers=followers, friends=followers // 10)
+
+    return FakeBot
+
+
+def measure(bot_class):
+    start = time.time()
+    bot = bot_class()
+    constructed = time.time()
+
+    bot._check_mentions()
+    polled = time.time()
+
+    bot.graph_ready.wait()
+    graph_loaded = time.time()
+
+    return (constructed - start, polled - start, graph_loaded - start)
+
+
+def main(argv):
+    fake_followers = None
+    if '--fake' in argv:
+        i = argv.index('--fake')
+        fake_followers = int(argv[i + 1])
+        argv = argv[:i] + argv[i + 2:]
+
+    if len(argv) < 2:
+        sys.exit('Usage: python benchmarks/startup.py FILE:CLASS [runs] [--fake FOLLOWERS]')
+
+    path, class_name = argv[1].rsplit(':', 1)
+    runs = int(argv[2]) if len(argv) > 2 else 3
+    bot_class = getattr(imp.load_source('benchmarked_bot', path), class_name)
+
+    if fake_followers is not None:
+        bot_class = with_fake_api(bot_class, fake_followers)
+
+    print('{:>5} {:>12} {:>15} {:>15}'.format('run', 'init (s)', 'first poll (s)', 'graph (s)'))
+    for run in range(runs):
+        print('{:>5} {:>12.3f} {:>15.3f} {:>15.3f}'.format(run + 1, *measure(bot_class)))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
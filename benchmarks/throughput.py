@@ -0,0 +1,144 @@
+#!/usr/bin/env python2
+# -*- coding: utf-8 -*- #
+#
+# throughput.py
+# -------------
+#
+# Runs a bot against twitterbot.fake.FakeAPI in a few configurations and
+# reports how many mentions it handled per second, how long replies took to
+# go out after the mention arrived, peak memory and the size of the saved
+# state.
+#
+#     python benchmarks/throughput.py [seconds] [mentions per second] [api latency]
+#
+# Each configuration runs in its own process, in a temporary directory, so
+# memory numbers don't bleed into each other and nothing is left behind.
+
+from __future__ import division
+from __future__ import print_function
+
+import logging
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import cPickle as pickle
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from twitterbot import TwitterBot
+from twitterbot.fake import FakeAPI
+
+
+CONFIGS = [
+    ('run', {}),
+    ('run, action_workers=4', {'action_workers': 4}),
+    ('run, state_journal', {'state_journal': True}),
+    ('run_async', {'run_async': True}),
+    ('run_async, action_workers=4', {'run_async': True, 'action_workers': 4}),
+]
+
+
+class EchoBot(TwitterBot):
+
+    def bot_init(self):
+        for key in ('api_key', 'api_secret', 'access_key', 'access_secret'):
+            self.config[key] = 'benchmark'
+
+        self.config['tweet_interval'] = 24 * 60 * 60
+        self.config['follower_interval'] = 24 * 60 * 60
+        self.config['mention_interval'] = 1
+        self.config['timeline_interval'] = 1
+        self.config['rate_limits'] = {}
+        # measure how fast replies can go out, not how far apart they're spaced
+        self.config['reply_interval'] = 0
+        self.config['logging_level'] = logging.INFO
+
+        self.config.update(self.benchmark_config)
+
+
+    def on_scheduled_tweet(self):
+        pass
+
+
+    def on_mention(self, tweet, prefix):
+        self.post_tweet(prefix + ' ' + tweet.text[:100], reply_to=tweet)
+
+
+    def on_timeline(self, tweet, prefix):
+        pass
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def measure(config, seconds, rate, latency, results):
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+
+    try:
+        config = dict(config)
+        run_async = config.pop('run_async', False)
+
+        api = FakeAPI(followers=20000, mention_rate=rate, timeline_rate=rate, latency=latency, seed=1)
+        config['api'] = api
+        EchoBot.benchmark_config = config
+
+        bot = EchoBot()
+        bot.graph_ready.wait()
+
+        # the scheduler only exists once the bot is running
+        threading.Timer(seconds, lambda: bot.scheduler.stop()).start()
+
+        start = time.time()
+        if run_async:
+            bot.run_async()
+        else:
+            bot.run()
+        elapsed = time.time() - start
+
+        replies = api.reply_latencies
+        results.put((
+            len(replies) / elapsed,
+            percentile(replies, 0.5),
+            percentile(replies, 0.95),
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            len(pickle.dumps(dict(bot.state), pickle.HIGHEST_PROTOCOL)) / 1024,
+        ))
+
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv):
+    seconds = float(argv[1]) if len(argv) > 1 else 10
+    rate = float(argv[2]) if len(argv) > 2 else 50
+    latency = float(argv[3]) if len(argv) > 3 else 0.05
+
+    print('{:.0f}s per run, {:.0f} mentions/s, {:.0f} ms per API call\n'.format(seconds, rate, latency * 1000))
+    print('{:<30} {:>12} {:>10} {:>10} {:>10} {:>11}'.format(
+        'config', 'mentions/s', 'p50 (s)', 'p95 (s)', 'peak MB', 'state KB'))
+
+    for name, config in CONFIGS:
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=measure, args=(config, seconds, rate, latency, results))
+        process.start()
+        process.join()
+
+        if process.exitcode != 0:
+            print('{:<30} failed'.format(name))
+            continue
+
+        print('{:<30} {:>12.1f} {:>10.2f} {:>10.2f} {:>10.1f} {:>11.1f}'.format(name, *results.get()))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -84,8 +84,9 @@ class EchoBot(TwitterBot):
         """
         Defines actions to take when a mention is received.
 
-        tweet - a tweepy.Status object. You can access the text with
-        tweet.text
+        tweet - a TweetRecord (a trimmed-down tweepy.Status). You can access
+        the text with tweet.text, and the original JSON with tweet.raw if
+        config['keep_raw_tweets'] is on.
 
         prefix - the @-mentions for this reply. No need to include this in the
         reply string; it's provided so you can use it to make sure the value
@@ -106,8 +107,9 @@ class EchoBot(TwitterBot):
         """
         Defines actions to take on a timeline tweet.
 
-        tweet - a tweepy.Status object. You can access the text with
-        tweet.text
+        tweet - a TweetRecord (a trimmed-down tweepy.Status). You can access
+        the text with tweet.text, and the original JSON with tweet.raw if
+        config['keep_raw_tweets'] is on.
 
         prefix - the @-mentions for this reply. No need to include this in the
         reply string; it's provided so you can use it to make sure the value
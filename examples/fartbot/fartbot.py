@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*- #
 
 from twitterbot import TwitterBot
-from random import choice
+from twitterbot.corpus import Corpus
 
 class FartBot(TwitterBot):
     def bot_init(self):
@@ -66,8 +66,9 @@ class FartBot(TwitterBot):
 
         # self.state['butt_counter'] = 0
 
-        with open('/usr/share/dict/words') as f:
-            self.words = [w.strip() for w in f.readlines()]
+        # memory-mapped, so it's shared with any other bot using the same
+        # file instead of being read into a list by each one
+        self.words = Corpus('/usr/share/dict/words')
 
         # You can also add custom functions that run at regular intervals
         # using self.register_custom_handler(function, interval).
@@ -88,7 +89,7 @@ class FartBot(TwitterBot):
 
         Set tweet frequency in seconds with TWEET_INTERVAL in config.py.
         """
-        text = 'fart ' + choice(self.words)
+        text = 'fart ' + self.words.random_line()
         self.post_tweet(text)
         
 
@@ -96,8 +97,9 @@ class FartBot(TwitterBot):
         """
         Defines actions to take when a mention is received.
 
-        tweet - a tweepy.Status object. You can access the text with
-        tweet.text
+        tweet - a TweetRecord (a trimmed-down tweepy.Status). You can access
+        the text with tweet.text, and the original JSON with tweet.raw if
+        config['keep_raw_tweets'] is on.
 
         prefix - the @-mentions for this reply. No need to include this in the
         reply string; it's provided so you can use it to make sure the value
@@ -109,7 +111,7 @@ class FartBot(TwitterBot):
         When calling post_tweet, you MUST include reply_to=tweet, or
         Twitter won't count it as a reply.
         """
-        text = 'fart ' + choice(self.words)
+        text = 'fart ' + self.words.random_line()
         prefixed_text = prefix + ' ' + text
         self.post_tweet(prefix + ' ' + text, reply_to=tweet)
 
@@ -122,8 +124,9 @@ class FartBot(TwitterBot):
         """
         Defines actions to take on a timeline tweet.
 
-        tweet - a tweepy.Status object. You can access the text with
-        tweet.text
+        tweet - a TweetRecord (a trimmed-down tweepy.Status). You can access
+        the text with tweet.text, and the original JSON with tweet.raw if
+        config['keep_raw_tweets'] is on.
 
         prefix - the @-mentions for this reply. No need to include this in the
         reply string; it's provided so you can use it to make sure the value
@@ -136,7 +139,7 @@ class FartBot(TwitterBot):
         Twitter won't count it as a reply.
         """
         if 'fart' in tweet.text.lower():
-            text = 'fart ' + choice(self.words)
+            text = 'fart ' + self.words.random_line()
             prefixed_text = prefix + ' ' + text
             self.post_tweet(prefix + ' ' + text, reply_to=tweet)
 
@@ -32,6 +32,10 @@ class MyTwitterBot(TwitterBot):
         # e.g., self.config['tweet_interval_range'] = (5*60, 10*60) # tweets every 5-10 minutes
         self.config['tweet_interval_range'] = None
 
+        # how often to check for new mentions and timeline tweets, in seconds
+        self.config['mention_interval'] = 60
+        self.config['timeline_interval'] = 60
+
         # only reply to tweets that specifically mention the bot
         self.config['reply_direct_mention_only'] = False
 
@@ -47,6 +51,27 @@ class MyTwitterBot(TwitterBot):
         # follow back all followers?
         self.config['autofollow'] = False
 
+        # wait this many seconds between replies (or a random number of
+        # seconds in a (min, max) range)? replies wait in the background, and
+        # ones still waiting when the bot stops are posted when it restarts
+        self.config['reply_interval'] = 10
+        self.config['reply_interval_range'] = None
+
+        # post/fav/follow in the background on this many threads? (with this
+        # on, post_tweet returns a Future instead of True/False)
+        self.config['action_workers'] = 0
+
+        # only write the parts of the bot's state that changed on each save,
+        # instead of the whole thing?
+        self.config['state_journal'] = False
+
+        # serve Prometheus metrics (API latency, posts, errors...) on this
+        # port at /metrics? None for off
+        self.config['metrics_port'] = None
+
+        # write the log file as JSON lines instead of plain text?
+        self.config['log_json'] = False
+
 
         ###########################################
         # CUSTOM: your bot's own state variables! #
@@ -58,6 +83,13 @@ class MyTwitterBot(TwitterBot):
 
         # self.state['butt_counter'] = 0
 
+        # To check tweets for lots of trigger words quickly, build a
+        # twitterbot.KeywordMatcher(list_of_words) once here and call
+        # .matches(tweet.text) in your handlers.
+
+        # If you change a saved value in place (e.g. append to a list), call
+        # self.state.touch('key') afterwards so the change gets saved.
+
         # You can also add custom functions that run at regular intervals
         # using self.register_custom_handler(function, interval).
         #
@@ -87,8 +119,9 @@ class MyTwitterBot(TwitterBot):
         """
         Defines actions to take when a mention is received.
 
-        tweet - a tweepy.Status object. You can access the text with
-        tweet.text
+        tweet - a TweetRecord (a trimmed-down tweepy.Status). You can access
+        the text with tweet.text, and the original JSON with tweet.raw if
+        config['keep_raw_tweets'] is on.
 
         prefix - the @-mentions for this reply. No need to include this in the
         reply string; it's provided so you can use it to make sure the value
@@ -115,8 +148,9 @@ class MyTwitterBot(TwitterBot):
         """
         Defines actions to take on a timeline tweet.
 
-        tweet - a tweepy.Status object. You can access the text with
-        tweet.text
+        tweet - a TweetRecord (a trimmed-down tweepy.Status). You can access
+        the text with tweet.text, and the original JSON with tweet.raw if
+        config['keep_raw_tweets'] is on.
 
         prefix - the @-mentions for this reply. No need to include this in the
         reply string; it's provided so you can use it to make sure the value
@@ -1,4 +1,10 @@
 __version__ = '0.1.0'
 __author__ = 'thricedotted'
 
-from twitterbot.bot import TwitterBot, ignore
+import logging
+logging.getLogger('twitterbot').addHandler(logging.NullHandler())
+
+from twitterbot.bot import TwitterBot, cpu_bound, ignore
+from twitterbot.host import BotHost
+from twitterbot.matching import KeywordMatcher
+from twitterbot.storage import FileStorage, SqliteStorage
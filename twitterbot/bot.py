@@ -15,10 +15,32 @@ import tweepy
 import time
 import re
 import random
+import threading
+import itertools
+import multiprocessing
 import cPickle as pickle
 
+from collections import deque
 from httplib import IncompleteRead
 
+from twitterbot.dedup import SeenTweets
+from twitterbot.followers import FollowerIndex
+from twitterbot.logs import LOG_QUEUE_SIZE, QueueHandler, QueueListener, RelayHandler, log_handler
+from twitterbot.matching import KeywordMatcher, TimelineFilter
+from twitterbot.media import UPLOAD_COMMANDS, MediaCache, MediaUploader
+from twitterbot.metrics import Metrics
+from twitterbot.pacing import PendingReplies
+from twitterbot.prefix import MentionPrefixer
+from twitterbot.profiling import HandlerProfiler
+from twitterbot.queues import TweetQueue
+from twitterbot.records import TweetRecord
+from twitterbot.scheduler import Scheduler
+from twitterbot.executor import ActionExecutor, Future, WorkerPool
+from twitterbot.ratelimit import RateGovernor, is_rate_limit_error, reset_time
+from twitterbot.state import BotState, ProgressLog, StateJournal, sizeof
+from twitterbot.storage import FileStorage
+from twitterbot.users import UserCache
+
 
 def ignore(method):
     """
@@ -29,12 +51,68 @@ def ignore(method):
     return method
 
 
+def cpu_bound(method):
+    """
+    Use the @cpu_bound decorator on on_mention or on_timeline to run it in a
+    pool of worker processes when config['cpu_workers'] is set. Instead of
+    posting a reply itself, the method returns the text of the reply (or a
+    (text, media) tuple, or None for no reply), which the bot posts in the
+    order the tweets came in.
+
+    The method runs in a copy of the bot, so changes it makes to the bot or
+    its state are lost. Load models and the like in worker_init(). If a
+    worker doesn't answer within config['cpu_worker_timeout'] seconds, the
+    method is run in the bot's own process instead.
+    """
+    method.cpu_bound = True
+    return method
+
+
+# bots by screen name, for their worker processes (which are forked, so they
+# get a copy of this)
+_cpu_bots = {}
+
+
+def _init_cpu_worker(screen_name, log_queue):
+    # the log handlers copied from the parent may have been mid-write (with
+    # their locks held) when it forked, and several processes rotating one
+    # file corrupts it, so send records back to the parent to be written
+    bot = _cpu_bots[screen_name]
+    logging.getLogger().handlers = [QueueHandler(log_queue)]
+    bot.logger.handlers = []
+    bot.logger.propagate = True
+    bot.worker_init()
+
+
+def _run_cpu_handler(screen_name, name, tweet, prefix):
+    return getattr(_cpu_bots[screen_name], name)(tweet, prefix)
+
+
+def _copy_result(source, target):
+    if source.exception() is not None:
+        target.set_exception(source.exception())
+    else:
+        target.set_result(source.result())
+
+
 class TwitterBot:
 
-    def __init__(self):
+    def __init__(self, host=None):
+        self.started_at = time.time()
+        self.time_to_first_poll = None
+
         self.config = {}
+        self.host = host
 
         self.custom_handlers = []
+        self.scheduler = None
+        self.reply_job = None
+        self.reply_lock = threading.Lock()
+        self.poll_futures = set()
+        self.pool = None
+        self.cpu_pool = None
+        self.worker_log_listener = None
+        self.worker_ready = False
 
         self.config['reply_direct_mention_only'] = False
         self.config['reply_followers_only'] = True
@@ -44,38 +122,206 @@ class TwitterBot:
 
         self.config['autofollow'] = False
 
+        # number of threads posting, faving and following in the background
+        # (0 does it all inline, and post_tweet returns True/False directly)
+        self.config['action_workers'] = 0
+
+        # pace outbound calls to stay within Twitter's limits:
+        # {endpoint: (calls, per_seconds)}
+        self.config['rate_limits'] = {
+            'update_status': (300, 3 * 60 * 60),
+            'create_favorite': (1000, 24 * 60 * 60),
+            'create_friendship': (400, 24 * 60 * 60),
+        }
+
+        # how often to check followers, mentions and the home timeline, in
+        # seconds (fractions of a second are fine)
+        self.config['follower_interval'] = 15 * 60
+        self.config['mention_interval'] = 60
+        self.config['timeline_interval'] = 60
+
         self.config['tweet_interval'] = 30 * 60
         self.config['tweet_interval_range'] = None
 
+        # seconds between replies, or a (min, max) range to pick a random
+        # number of seconds from each time; replies wait their turn in the
+        # background, so polling and scheduled tweets carry on meanwhile
+        # (0 posts them straight away)
         self.config['reply_interval'] = 10
         self.config['reply_interval_range'] = None
 
+        # max number of pages of mentions/timeline to fetch per check; if more
+        # than this came in since the last check, the rest are fetched later
+        self.config['max_pages_per_poll'] = 4
+
+        # max number of queued mentions to handle per check (None for all)
+        self.config['mention_batch_size'] = None
+
+        # max number of mentions to keep queued, and which to drop when
+        # there are more: 'oldest', or 'priority' (see mention_priority);
+        # replies waiting for reply_interval are limited the same way
+        self.config['mention_queue_size'] = 10000
+        self.config['mention_drop_policy'] = 'oldest'
+
+        # max number of tweets to keep from each timeline check (newest win)
+        self.config['timeline_size'] = 1000
+
+        # log how much memory each state key takes up this often, in seconds
+        # (None for never; see memory_report)
+        self.config['memory_report_interval'] = None
+
         self.config['ignore_timeline_mentions'] = True
 
+        # how long to keep users fetched with get_users(), in seconds
+        self.config['user_cache_ttl'] = 60 * 60
+
+        # how many handled/replied-to tweet ids to remember, so a restart
+        # after a crash doesn't handle (and reply to) the same tweet twice
+        self.config['seen_tweets_capacity'] = 2000
+
+        # keep each tweet's raw JSON payload around as tweet.raw?
+        self.config['keep_raw_tweets'] = False
+
         self.config['logging_level'] = logging.DEBUG
+
+        # start a new <screen_name>.log once it reaches log_max_bytes (or
+        # every log_rotate_when instead, e.g. 'midnight'; None for neither),
+        # keeping log_backup_count old ones
+        self.config['log_max_bytes'] = 10 * 1024 * 1024
+        self.config['log_rotate_when'] = None
+        self.config['log_backup_count'] = 5
+
+        # write the log as JSON lines instead of plain text
+        self.config['log_json'] = False
+
+        # write the log from a background thread, so tweeting and polling
+        # never wait on the disk
+        self.config['log_background'] = True
+
         self.config['storage'] = FileStorage()
 
-        self.state = {}
+        # save only the state keys that changed since the last save, folding
+        # them into a full snapshot every journal_compact_every saves
+        self.config['state_journal'] = False
+        self.config['journal_compact_every'] = 100
+
+        # serve Prometheus metrics at http://localhost:<port>/metrics (None
+        # for off; hosted bots use the host's endpoint instead)
+        self.config['metrics_port'] = None
+
+        # number of processes to run @cpu_bound handlers on (0 runs them
+        # inline like everything else)
+        self.config['cpu_workers'] = 0
+
+        # seconds to wait for a worker process's reply before giving up on
+        # it and running the handler here instead
+        self.config['cpu_worker_timeout'] = 60
+
+        # time every on_mention/on_timeline/etc. call, logging ones slower
+        # than slow_handler_seconds; kill -USR2 the bot to write a cProfile
+        # dump of the next profile_dump_calls calls
+        self.config['profile_handlers'] = False
+        self.config['slow_handler_seconds'] = 1.0
+        self.config['profile_dump_calls'] = 50
+
+        # an API object to use instead of connecting to Twitter, such as a
+        # twitterbot.fake.FakeAPI
+        self.config['api'] = None
+
+        self.state = BotState()
 
         # call the custom initialization
         self.bot_init()
 
-        auth = tweepy.OAuthHandler(self.config['api_key'], self.config['api_secret'])
-        auth.set_access_token(self.config['access_key'], self.config['access_secret'])
-        self.api = tweepy.API(auth)
+        if self.config['api'] is not None:
+            self.api = self.config['api']
+        else:
+            auth = tweepy.OAuthHandler(self.config['api_key'], self.config['api_secret'])
+            auth.set_access_token(self.config['access_key'], self.config['access_secret'])
+            self.api = tweepy.API(auth)
+
+        if host is not None:
+            # hosted bots share the host's threads instead of starting their own
+            self.actions = host.actions
+            self.pool = host.pool
+        elif self.config['action_workers'] > 0:
+            self.actions = ActionExecutor(self.config['action_workers'])
+        else:
+            self.actions = None
+
+        self.id, self.screen_name, identity_cached = self._load_identity()
+
+        self.logger = logging.getLogger('twitterbot.' + self.screen_name)
+        self.logger.setLevel(self.config['logging_level'])
+
+        self.log_listener = None
+        root = logging.getLogger()
+
+        # like logging.basicConfig, leave the root logger alone if it's
+        # already set up; but the root logger belongs to the host, so hosted
+        # bots get their own file
+        if host is not None or not root.handlers:
+            handler, self.log_listener = log_handler(self.screen_name + '.log',
+                    max_bytes=self.config['log_max_bytes'],
+                    backup_count=self.config['log_backup_count'],
+                    rotate_when=self.config['log_rotate_when'],
+                    json_lines=self.config['log_json'],
+                    background=self.config['log_background'])
+
+            if host is None:
+                root.addHandler(handler)
+                root.setLevel(self.config['logging_level'])
+            else:
+                self.logger.addHandler(handler)
+                self.logger.propagate = False
 
-        self.id = self.api.me().id
-        self.screen_name = self.api.me().screen_name
+        self.logger.info('Initializing bot...')
 
-        logging.basicConfig(format='%(asctime)s | %(levelname)s: %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p', 
-            filename=self.screen_name + '.log',
-            level=self.config['logging_level'])
+        if host is not None:
+            registry = host.metrics
+        else:
+            registry = Metrics()
+            if self.config['metrics_port'] is not None:
+                registry.serve(self.config['metrics_port'])
+        self.metrics = registry.labelled(bot=self.screen_name)
+
+        if self.config['profile_handlers']:
+            self.profiler = HandlerProfiler(self.metrics, logger=self.logger,
+                    slow_seconds=self.config['slow_handler_seconds'],
+                    dump_calls=self.config['profile_dump_calls'],
+                    prefix=self.screen_name)
+            self.profiler.install_signal()
+        else:
+            self.profiler = None
 
-        logging.info('Initializing bot...')
+        # compiled once here rather than for every tweet
+        self.timeline_filter = TimelineFilter(self.screen_name, self.config['ignore_timeline_mentions'])
+        self.direct_mention_pattern = re.compile(r'@{}(?![@\w])'.format(re.escape(self.screen_name)))
+        self.autofav_matcher = KeywordMatcher(self.config['autofav_keywords'])
+        self.prefixer = MentionPrefixer(self.screen_name)
+
+        self.users = UserCache(lambda ids: self._call_api('lookup_users', user_ids=ids),
+                ttl=self.config['user_cache_ttl'])
+
+        self.governor = RateGovernor(self.config['rate_limits'], logger=self.logger)
+
+        storage = self.config['storage']
+
+        # adapters that save state themselves already only write what changed
+        if self.config['state_journal'] and not hasattr(storage, 'save_state'):
+            self.journal = StateJournal(self.config['storage'], self.screen_name,
+                    compact_every=self.config['journal_compact_every'], logger=self.logger)
+        else:
+            self.journal = None
 
         try:
-            with self.config['storage'].read(self.screen_name) as f:
-                self.state = pickle.load(f)
+            if hasattr(storage, 'load_state'):
+                self.state = BotState(storage.load_state(self.screen_name))
+            elif self.journal is not None:
+                self.state = self.journal.load()
+            else:
+                with self.config['storage'].read(self.screen_name) as f:
+                    self.state = BotState(pickle.load(f))
 
         except IOError:
             self.state['last_timeline_id'] = 1
@@ -91,14 +337,151 @@ class TwitterBot:
             self.state['last_reply_time'] = 0
 
             self.state['recent_timeline'] = []
-            self.state['mention_queue'] = []
+            self.state['mention_queue'] = TweetQueue()
+
+            self.state['mention_gaps'] = []
+            self.state['timeline_gaps'] = []
+
+        # state saved by an older version stored lists of tweepy.Status objects
+        if isinstance(self.state['mention_queue'], list):
+            self.state['mention_queue'] = TweetQueue(self._records(self.state['mention_queue']))
+        self.state['recent_timeline'] = self._records(self.state['recent_timeline'])
+        self.state.setdefault('mention_gaps', [])
+        self.state.setdefault('timeline_gaps', [])
+
+        queue = self.state['mention_queue']
+        queue.maxlen = self.config['mention_queue_size']
+        queue.policy = self.config['mention_drop_policy']
+        queue.priority = self.mention_priority
+        if queue.trim():
+            self.state.touch('mention_queue')
+
+        self.state.setdefault('uploaded_media', MediaCache())
+        self.state.setdefault('pending_replies', PendingReplies())
+
+        pending = self.state['pending_replies']
+        pending.maxlen = self.config['mention_queue_size']
+        pending.policy = self.config['mention_drop_policy']
+        pending.priority = self.mention_priority
+        if pending.trim():
+            self.state.touch('pending_replies')
+        self.media = MediaUploader(self.api, self._call_api, self.state['uploaded_media'], logger=self.logger)
+
+        if 'seen_tweets' not in self.state:
+            self.state['seen_tweets'] = SeenTweets(self.config['seen_tweets_capacity'])
+        self.state['seen_tweets'].capacity = self.config['seen_tweets_capacity']
+
+        # work done between saves is logged as it happens, so a crash
+        # partway through a batch neither loses it nor repeats it
+        if hasattr(storage, 'append'):
+            self.progress = ProgressLog(storage, self.screen_name, logger=self.logger)
+            self._replay_progress()
+        else:
+            self.progress = None
+
+        # an index saved by a previous run is kept as-is, so the first
+        # follower check also picks up anyone who followed while we were down;
+        # missing ones are downloaded in the background
+        missing_graph = []
+        for key, endpoint in (('friends', 'friends_ids'), ('followers', 'followers_ids')):
+            if isinstance(self.state.get(key), list):
+                # state saved by an older version stored plain lists
+                self.state[key] = FollowerIndex(self.state[key])
+            elif key not in self.state:
+                missing_graph.append((key, endpoint))
 
-        self.state['friends'] = self.api.friends_ids(self.id)
-        self.state['followers'] = self.api.followers_ids(self.id)
         self.state['new_followers'] = []
-        self.state['last_follow_check'] = 0
+        self.state.setdefault('last_follow_check', 0)
+
+        self.graph_ready = threading.Event()
+        loader = threading.Thread(target=self._load_graph, args=(missing_graph, identity_cached),
+                name='twitterbot-startup-' + self.screen_name)
+        loader.daemon = True
+        loader.start()
+
+        if self.journal is not None:
+            # start each run from a fresh snapshot instead of an ever-growing journal
+            with self.progress.saving():
+                self.journal.compact(self.state)
+
+        self.logger.info('Bot initialized!')
+
+
+    def _identity_cache_name(self):
+        """
+        Returns the storage name the identity is cached under, or None if
+        there's no access token to tell accounts apart by (a bot that only
+        sets config['api'], say), in which case it isn't cached.
+        """
+        access_key = self.config.get('access_key')
+        if not access_key:
+            return None
+        # access tokens start with the account's user id
+        return 'identity_' + access_key.split('-')[0]
+
+
+    def _load_identity(self):
+        """
+        Returns (id, screen_name, whether it came from the cache) for the
+        bot's account. The result of api.me() is cached through the storage
+        adapter so restarts don't have to wait for it.
+        """
+        if self._identity_cache_name() is not None:
+            try:
+                with self.config['storage'].read(self._identity_cache_name()) as f:
+                    user_id, screen_name = pickle.load(f)
+                    return user_id, screen_name, True
+            except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+                pass
+
+        me = self.api.me()
+        self._save_identity(me)
+        return me.id, me.screen_name, False
+
+
+    def _save_identity(self, me):
+        if self._identity_cache_name() is None:
+            return
+        with self.config['storage'].write(self._identity_cache_name()) as f:
+            pickle.dump((me.id, me.screen_name), f)
+
+
+    def _load_graph(self, missing, identity_cached):
+        """
+        Runs in the background at startup: downloads any follower/friend
+        indexes that weren't in the saved state, and checks that the cached
+        identity is still right.
+        """
+        try:
+            for key, endpoint in missing:
+                try:
+                    self.state[key] = FollowerIndex(self._fetch_ids(endpoint))
+                    self.logger.info('Loaded %s (%d ids)', key, len(self.state[key]))
+                except (tweepy.TweepError, IncompleteRead) as e:
+                    # left missing; _check_followers builds it on its next run
+                    self.logger.error('Unable to load %s: %s', key, e)
 
-        logging.info('Bot initialized!')
+            if identity_cached:
+                me = self.api.me()
+                if (me.id, me.screen_name) != (self.id, self.screen_name):
+                    self.logger.warning('Account is now @%s; restart the bot to pick up the new name', me.screen_name)
+                    self._save_identity(me)
+
+        except Exception:
+            self.logger.exception('Error during background startup')
+
+        finally:
+            self.graph_ready.set()
+
+
+    def _wait_for_graph(self):
+        """
+        Blocks until the follower/friend indexes are loaded (which is right
+        away unless the bot just started without them).
+        """
+        if not self.graph_ready.is_set():
+            self.logger.debug('Waiting for followers to load...')
+            self.graph_ready.wait()
 
 
     def bot_init(self):
@@ -108,20 +491,168 @@ class TwitterBot:
         raise NotImplementedError("You MUST have bot_init() implemented in your bot! What have you DONE!")
 
 
-    def log(self, message, level=logging.INFO):
-        if level == logging.ERROR:
-            logging.error(message)
-        else:
-            logging.info(message)
+    def log(self, message, level=logging.INFO, *args):
+        """
+        Log a message at level (logging.INFO by default). Like the logging
+        module, message is only %-formatted with args if it gets logged:
+
+            self.log('Replying to %s', logging.INFO, tweet.author.screen_name)
+        """
+        self.logger.log(level, message, *args)
 
 
     def _log_tweepy_error(self, message, e):
+        self.metrics.increment('twitterbot_errors_total', code=getattr(e, 'api_code', None) or 'unknown')
+
         try:
             e_message = e.message[0]['message']
             code = e.message[0]['code']
-            self.log("{}: {} ({})".format(message, e_message, code), level=logging.ERROR)
+            self.logger.error('%s: %s (%s)', message, e_message, code)
         except:
-            self.log(message, e)
+            self.logger.error('%s: %s', message, e)
+
+
+    def _records(self, statuses):
+        """
+        Converts tweepy.Status objects to compact TweetRecords.
+        """
+        return [TweetRecord.from_status(s, keep_raw=self.config['keep_raw_tweets']) for s in statuses]
+
+
+    def _call_api(self, endpoint, *args, **kwargs):
+        """
+        Calls an API method, waiting first if its rate limit (or outbound
+        pacing) says so, and recording the rate limit the response reports.
+        """
+        self.governor.acquire(endpoint)
+        start = time.time()
+
+        try:
+            if endpoint in UPLOAD_COMMANDS and not hasattr(self.api, endpoint):
+                return UPLOAD_COMMANDS[endpoint](self.api, *args, **kwargs)
+            return getattr(self.api, endpoint)(*args, **kwargs)
+
+        except tweepy.TweepError as e:
+            if is_rate_limit_error(e):
+                self.metrics.increment('twitterbot_rate_limited_total', endpoint=endpoint)
+                self.governor.exhaust(endpoint, reset_time(e))
+            raise
+
+        finally:
+            self.metrics.observe('twitterbot_api_seconds', time.time() - start, endpoint=endpoint)
+            self.governor.update(endpoint, getattr(self.api, 'last_response', None))
+
+
+    def _page_back(self, endpoint, since_id, max_id, count, budget):
+        """
+        Fetches pages of tweets with since_id < id <= max_id (or just newer
+        than since_id if max_id is None), newest first, until the range is
+        exhausted, budget pages have been fetched or the endpoint is rate
+        limited.
+
+        Returns (pages, newest id seen, max_id of the part of the range that's
+        still left or None if there isn't any, number of pages fetched).
+        """
+        pages = []
+        newest = None
+        fetched = 0
+
+        while fetched < budget and self.governor.delay(endpoint) == 0:
+            kwargs = {'since_id': since_id, 'count': count}
+            if max_id is not None:
+                kwargs['max_id'] = max_id
+
+            try:
+                page = self._records(self._call_api(endpoint, **kwargs))
+            except tweepy.TweepError as e:
+                if not is_rate_limit_error(e):
+                    raise
+                # keep what we have; the rest is left for when the limit resets
+                break
+            fetched += 1
+
+            if len(page) == 0:
+                return pages, newest, None, fetched
+
+            if newest is None:
+                newest = page[0].id
+
+            pages.append(page)
+            max_id = page[-1].id - 1
+
+            # pages can come back short while older tweets remain (count is
+            # applied before deleted and suspended tweets are taken out), so
+            # only stop once there's nothing left between since_id and max_id
+            if max_id <= since_id:
+                return pages, newest, None, fetched
+
+        return pages, newest, max_id, fetched
+
+
+    def _fetch_new_tweets(self, endpoint, last_id_key, gaps_key, count):
+        """
+        Yields every tweet from a timeline endpoint newer than
+        state[last_id_key], oldest first.
+
+        Pages back from the newest tweet with max_id until it meets the last
+        one seen, fetching at most config['max_pages_per_poll'] pages. If
+        that isn't enough, the unfetched part is remembered in
+        state[gaps_key] and filled in, oldest gap first, on later calls, so
+        nothing is skipped. The same goes for running out of calls partway
+        through. Memory use is bounded by the page budget, not by how far
+        behind the bot is.
+
+        A bot that has never polled (state[last_id_key] is still 1) has no
+        gap to fill, so it starts from the newest page alone.
+        """
+        budget = self.config['max_pages_per_poll']
+        gaps = sorted(self.state[gaps_key])
+
+        while gaps and budget > 0 and self.governor.delay(endpoint) == 0:
+            since_id, max_id = gaps.pop(0)
+            pages, newest, left, fetched = self._page_back(endpoint, since_id, max_id, count, budget)
+            budget -= fetched
+
+            if left is not None:
+                gaps.insert(0, (since_id, left))
+            self.state[gaps_key] = list(gaps)
+
+            for page in reversed(pages):
+                for tweet in reversed(page):
+                    yield tweet
+
+        if budget == 0 or self.governor.delay(endpoint) > 0:
+            return
+
+        since_id = self.state[last_id_key]
+        first_poll = since_id <= 1
+        pages, newest, left, fetched = self._page_back(endpoint, since_id, None, count, 1 if first_poll else budget)
+
+        if left is not None and not first_poll:
+            self.logger.warning('Fetched %d pages of new tweets from %s; the rest will be fetched later', fetched, endpoint)
+            gaps.append((since_id, left))
+            self.state[gaps_key] = list(gaps)
+
+        if newest is not None:
+            self.state[last_id_key] = newest
+
+        for page in reversed(pages):
+            for tweet in reversed(page):
+                yield tweet
+
+
+    def _fetch_ids(self, endpoint):
+        """
+        Returns every id from a cursored endpoint like followers_ids.
+        """
+        ids = []
+        cursor = -1
+
+        while cursor:
+            page, (previous, cursor) = self._call_api(endpoint, id=self.id, cursor=cursor)
+            ids.extend(page)
+
+        return ids
 
 
     def _tweet_url(self, tweet):
@@ -129,11 +660,63 @@ class TwitterBot:
 
 
     def _save_state(self):
+        if self.poll_futures:
+            # a check on the poll pool is changing the state; its handler
+            # saves it once it's done
+            return
+
+        with self.metrics.timer('twitterbot_save_seconds'):
+            if self.progress is None:
+                self._write_state()
+            else:
+                with self.progress.saving():
+                    self._write_state()
+
+
+    def _write_state(self):
+        if hasattr(self.config['storage'], 'save_state'):
+            self.config['storage'].save_state(self.screen_name, self.state)
+            self.logger.debug('Bot state saved')
+            return
+
+        if self.journal is not None:
+            self.journal.record(self.state)
+            self.logger.debug('Bot state journaled')
+            return
+
         with self.config['storage'].write(self.screen_name) as f:
-            pickle.dump(self.state, f)
+            pickle.dump(dict(self.state), f)
             self.log('Bot state saved')
 
 
+    def _replay_progress(self):
+        """
+        Applies the work recorded in the progress log since the state was
+        last saved: tweets handled and replies queued or sent.
+        """
+        entries = self.progress.load()
+        if not entries:
+            return
+
+        seen = self.state['seen_tweets']
+        pending = self.state['pending_replies']
+
+        for entry in entries:
+            if entry[0] == 'seen':
+                seen.add(entry[1])
+            elif entry[0] == 'queued':
+                # ones below next_seq were already in the saved state
+                if entry[1] >= pending.next_seq:
+                    pending.restore([entry[1:]])
+            elif entry[0] == 'sent':
+                pending.discard(entry[1])
+
+        pending.trim()
+        self.state.touch('seen_tweets')
+        self.state.touch('pending_replies')
+        self.logger.info('Replayed %d entries from the progress log', len(entries))
+
+
     def on_scheduled_tweet(self):
         """
         Post a general tweet to own timeline.
@@ -161,54 +744,369 @@ class TwitterBot:
 
     def on_follow(self, f_id):
         """
-        Perform some action when followed.
+        Perform some action when followed. self.get_user(f_id) has the new
+        follower's details without another API call.
         """
+        self._wait_for_graph()
+
         if self.config['autofollow']:
-            try:
-                self.api.create_friendship(f_id, follow=True)
-                self.state['friends'].append(f_id)
-                logging.info('Followed user id {}'.format(f_id))
-            except tweepy.TweepError as e:
-                self._log_tweepy_error('Unable to follow user', e)
+            if self.actions is not None:
+                self.actions.submit(None, self._follow, f_id)
+            else:
+                self._follow(f_id)
+                time.sleep(3)
 
-            time.sleep(3)
+        if 'followers' in self.state:
+            self.state['followers'].add(f_id)
+            self.state.touch('followers')
 
-        self.state['followers'].append(f_id)
+
+    def _follow(self, f_id):
+        try:
+            self._call_api('create_friendship', f_id, follow=True)
+            if 'friends' in self.state:
+                self.state['friends'].add(f_id)
+                self.state.touch('friends')
+            self.logger.info('Followed user id %s', f_id)
+            self.metrics.increment('twitterbot_follows_total')
+            return True
+        except tweepy.TweepError as e:
+            self._log_tweepy_error('Unable to follow user', e)
+            return False
+
+
+    def _submit_action(self, key, fn, *args):
+        """
+        Runs an outbound action on the action executor if there is one (and
+        returns its Future), or right here if not (and returns its result).
+        """
+        if self.actions is None:
+            return fn(*args)
+        return self.actions.submit(key, fn, *args)
 
 
     def post_tweet(self, text, reply_to=None, media=None):
+        """
+        Post a tweet, optionally as a reply to another one. media is a
+        filename or list of filenames to attach; big files are uploaded in
+        chunks, and files that were uploaded recently are reused instead of
+        being uploaded again.
+
+        Returns True if the tweet was posted. With config['action_workers']
+        set, returns a Future for that result instead; replies to the same
+        user are still posted in the order they were made.
+
+        Once the bot is running, replies are spaced out by
+        config['reply_interval']: they're queued and posted in the
+        background, and post_tweet returns a Future (which comes back False
+        if the reply is dropped because too many are waiting). With
+        reply_interval set to 0, replies are posted right away and the
+        result is returned as above.
+        """
+        if reply_to is not None and self._paces_replies():
+            return self._queue_reply(text, reply_to, media)
+
+        key = reply_to.author.id if reply_to else 'timeline'
+        return self._submit_action(key, self._post_tweet, text, reply_to, media)
+
+
+    def _paces_replies(self):
+        return self.scheduler is not None and bool(self.config['reply_interval'] or self.config['reply_interval_range'])
+
+
+    def _reply_interval(self):
+        if self.config['reply_interval_range'] is not None:
+            return random.uniform(*self.config['reply_interval_range'])
+        return self.config['reply_interval']
+
+
+    def _queue_reply(self, text, reply_to, media):
+        pending = self.state['pending_replies']
+
+        with self.reply_lock:
+            # replies are only added here, with reply_lock held
+            seq = pending.next_seq
+            dropped = pending.dropped
+            future = pending.add(text, reply_to, media)
+            dropped = pending.dropped - dropped
+            self.state.touch('pending_replies')
+
+            if self.progress is not None and not future.done():
+                self.progress.record('queued', seq, text, reply_to, media)
+
+            self._start_reply_job()
+
+        if dropped:
+            self.logger.warning('Too many replies waiting to be posted; dropped %d', dropped)
+            self.metrics.increment('twitterbot_dropped_total', dropped, key='pending_replies')
+
+        self.metrics.set('twitterbot_pending_replies', len(pending))
+        return future
+
+
+    def _start_reply_job(self):
+        """
+        Schedules the reply job, unless it's already scheduled. It stops
+        itself whenever it runs out of replies. Call with reply_lock held.
+        """
+        if self.reply_job is None:
+            first_run = max(time.time(), self.state['pending_replies'].next_at)
+            self.reply_job = self.scheduler.add(self._reply_job, self.config['reply_interval'],
+                    first_run=first_run, name=self._job_name('replies'))
+
+
+    def _reply_job(self):
+        """
+        Posts the oldest pending reply. Returns how long until the next one
+        is due.
+        """
+        pending = self.state['pending_replies']
+
+        # out of posts for now: hold the replies until the limit resets
+        wait = self.governor.delay('update_status')
+        if wait > 0:
+            return wait
+
+        with self.reply_lock:
+            (seq, text, reply_to, media), future = pending.pop(time.time() + self._reply_interval())
+            self.state.touch('pending_replies')
+
+            if len(pending) == 0:
+                # _queue_reply starts it again, no sooner than next_at
+                self.reply_job.cancel()
+                self.reply_job = None
+
+        self.metrics.set('twitterbot_pending_replies', len(pending))
+
+        result = self._submit_action(reply_to.author.id, self._post_pending_reply, seq, text, reply_to, media)
+
+        if future is not None:
+            if isinstance(result, Future):
+                result.add_done_callback(lambda done: _copy_result(done, future))
+            else:
+                future.set_result(result)
+
+        return pending.delay(time.time())
+
+
+    def _post_pending_reply(self, seq, text, reply_to, media):
+        try:
+            return self._post_tweet(text, reply_to, media)
+        finally:
+            self.state['pending_replies'].done(seq)
+            self.state.touch('pending_replies')
+            if self.progress is not None:
+                self.progress.record('sent', seq)
+
+
+    def _post_tweet(self, text, reply_to=None, media=None):
         kwargs = {}
-        args = [text]
-        if media is not None:
-            cmd = self.api.update_with_media
-            args.insert(0, media)
-        else:
-            cmd = self.api.update_status
 
         try:
-            self.log('Tweeting "{}"'.format(text))
+            if media is not None:
+                kwargs['media_ids'] = self._media_ids(media)
+
+            self.logger.info('Tweeting "%s"', text)
             if reply_to:
-                self.log("-- Responding to status {}".format(self._tweet_url(reply_to)))
+                self.logger.info('-- Responding to status %s', self._tweet_url(reply_to))
                 kwargs['in_reply_to_status_id'] = reply_to.id
             else:
-                self.log("-- Posting to own timeline")
+                self.log('-- Posting to own timeline')
+
+            tweet = self._call_api('update_status', text, **kwargs)
+            self.logger.info('Status posted at %s', self._tweet_url(tweet))
+            self.metrics.increment('twitterbot_tweets_posted_total')
+
+            if reply_to:
+                # on disk before the handler goes on, so a crash from here
+                # on doesn't reply again
+                self._mark_handled(reply_to)
 
-            tweet = cmd(*args, **kwargs)
-            self.log('Status posted at {}'.format(self._tweet_url(tweet)))
             return True
 
         except tweepy.TweepError as e:
+            # 187 is "status is a duplicate": we already replied, last run
+            if reply_to and getattr(e, 'api_code', None) == 187:
+                self._mark_handled(reply_to)
             self._log_tweepy_error('Can\'t post status', e)
             return False
 
+        except (IOError, OSError) as e:
+            self.logger.error('Can\'t read media for status: %s', e)
+            return False
+
+
+    def _media_ids(self, media):
+        """
+        Returns media ids for a filename or list of filenames, uploading
+        only the ones that weren't uploaded recently.
+        """
+        filenames = [media] if isinstance(media, basestring) else media
+        media_ids = [self.media.media_id(filename) for filename in filenames]
+        self.state.touch('uploaded_media')
+        return media_ids
+
+
+    def next_tweet_media(self):
+        """
+        Override to return the file (or list of files) the next scheduled
+        tweet will attach, so they can be uploaded in the background ahead
+        of time. Called after each scheduled tweet.
+        """
+        return None
+
+
+    def _preload_media(self):
+        media = self.next_tweet_media()
+        if media is None:
+            return
+
+        def preload():
+            try:
+                self._media_ids(media)
+            except (tweepy.TweepError, IOError, OSError) as e:
+                # the upload is tried again when the tweet is posted
+                self.logger.warning('Couldn\'t upload media ahead of time: %s', e)
+
+        thread = threading.Thread(target=preload, name='twitterbot-media-' + self.screen_name)
+        thread.daemon = True
+        thread.start()
+
 
     def favorite_tweet(self, tweet):
+        """
+        Favorite a tweet. Returns True if it worked, or a Future for that
+        with config['action_workers'] set.
+        """
+        return self._submit_action(None, self._favorite_tweet, tweet)
+
+
+    def _favorite_tweet(self, tweet):
         try:
-            logging.info('Faving ' + self._tweet_url(tweet))
-            self.api.create_favorite(tweet.id)
+            self.logger.info('Faving %s', self._tweet_url(tweet))
+            self._call_api('create_favorite', tweet.id)
+            self.metrics.increment('twitterbot_favorites_total')
+            return True
 
         except tweepy.TweepError as e:
             self._log_tweepy_error('Can\'t fav status', e)
+            return False
+
+
+    def _dispatch(self, handler, tweet_id, *args):
+        """
+        Calls one of the bot's handlers, through the profiler if
+        config['profile_handlers'] is on.
+        """
+        if self.profiler is None:
+            return handler(*args)
+        return self.profiler.call(handler, tweet_id, *args)
+
+
+    def _seen(self, tweet):
+        """
+        Returns True if the bot already handled (or replied to) a tweet.
+        """
+        if tweet.id in self.state['seen_tweets']:
+            self.logger.debug('Skipping tweet %s, already handled', tweet.id)
+            self.metrics.increment('twitterbot_duplicates_skipped_total')
+            return True
+        return False
+
+
+    def _mark_seen(self, tweet):
+        self.state['seen_tweets'].add(tweet.id)
+        self.state.touch('seen_tweets')
+
+
+    def _mark_handled(self, tweet):
+        """
+        Marks a tweet seen, and records that in the progress log, so it
+        stays seen if the bot stops before the next save.
+        """
+        self._mark_seen(tweet)
+        if self.progress is not None:
+            self.progress.record('seen', tweet.id)
+
+
+    def worker_init(self):
+        """
+        Called once in each worker process when config['cpu_workers'] is
+        set, before it runs any @cpu_bound handlers. Load models here.
+
+        It's also called once in the bot's own process before the bot runs a
+        @cpu_bound handler itself (with cpu_workers off, or when a worker
+        timed out).
+        """
+        pass
+
+
+    def _start_cpu_pool(self):
+        if self.cpu_pool is None:
+            _cpu_bots[self.screen_name] = self
+            self.worker_log_listener = QueueListener([RelayHandler()], multiprocessing.Queue(LOG_QUEUE_SIZE))
+            self.worker_log_listener.start()
+            self.cpu_pool = multiprocessing.Pool(self.config['cpu_workers'], initializer=_init_cpu_worker,
+                    initargs=(self.screen_name, self.worker_log_listener.queue))
+            self.logger.info('Started %d worker processes', self.config['cpu_workers'])
+        return self.cpu_pool
+
+
+    def _stop_cpu_pool(self):
+        if self.cpu_pool is not None:
+            self.cpu_pool.terminate()
+            self.cpu_pool.join()
+            self.cpu_pool = None
+            self.worker_log_listener.stop()
+
+
+    def _offload(self, handler, tweets):
+        """
+        If handler is @cpu_bound and config['cpu_workers'] is set, start
+        running it on each tweet not seen yet in the worker processes.
+        Returns {tweet id: AsyncResult}.
+        """
+        if self.config['cpu_workers'] <= 0 or not getattr(handler, 'cpu_bound', False):
+            return {}
+
+        pool = self._start_cpu_pool()
+        return dict((tweet.id, pool.apply_async(_run_cpu_handler,
+                (self.screen_name, handler.__name__, tweet, self.get_mention_prefix(tweet))))
+                for tweet in tweets if tweet.id not in self.state['seen_tweets'])
+
+
+    def _run_handler(self, handler, tweet, prefix, offloaded):
+        """
+        Calls handler on a tweet, or waits for the reply it came up with in a
+        worker process. Posts the reply if the handler is @cpu_bound.
+        """
+        result = offloaded.pop(tweet.id, None)
+        if result is not None:
+            try:
+                reply = result.get(self.config['cpu_worker_timeout'])
+            except multiprocessing.TimeoutError:
+                # a worker is stuck (or died), and the rest of the batch would
+                # only wait behind it; new workers start with the next batch
+                self.logger.warning('No reply from worker processes for tweet %s after %ss, '
+                        'restarting them and handling the rest of this batch here',
+                        tweet.id, self.config['cpu_worker_timeout'])
+                offloaded.clear()
+                self._stop_cpu_pool()
+                result = None
+
+        if result is None:
+            if getattr(handler, 'cpu_bound', False) and not self.worker_ready:
+                self.worker_init()
+                self.worker_ready = True
+            reply = self._dispatch(handler, tweet.id, tweet, prefix)
+
+        if not getattr(handler, 'cpu_bound', False):
+            return
+
+        if isinstance(reply, tuple):
+            self.post_tweet(reply[0], reply_to=tweet, media=reply[1])
+        elif reply is not None:
+            self.post_tweet(reply, reply_to=tweet)
 
 
     def _ignore_method(self, method):
@@ -220,44 +1118,141 @@ class TwitterBot:
         Reads the latest tweets in the bots timeline and perform some action.
         self.recent_timeline
         """
+        offloaded = self._offload(self.on_timeline, self.state['recent_timeline'])
+
         for tweet in self.state['recent_timeline']:
+            if self._seen(tweet):
+                continue
+
             prefix = self.get_mention_prefix(tweet)
-            self.on_timeline(tweet, prefix)
+            self._run_handler(self.on_timeline, tweet, prefix, offloaded)
 
-            words = tweet.text.lower().split()
-            if any(w in words for w in self.config['autofav_keywords']):
+            if self.autofav_matcher.matches(tweet.text):
                 self.favorite_tweet(tweet)
 
-            #time.sleep(self.config['reply_interval'])
+            self._mark_handled(tweet)
 
 
     def _handle_mentions(self):
         """
         Performs some action on the mentions in self.mention_queue
+
+        At most config['mention_batch_size'] mentions are handled per call;
+        the rest stay queued for the next check. A mention is only removed
+        from the queue after it has been handled, and each one is recorded
+        in the progress log as it's done, so after a crash partway through a
+        batch the rest are still handled and the done ones aren't repeated.
         """
-        # TODO: only handle a certain number of mentions at a time?
-        for mention in iter(self.state['mention_queue']):
-            prefix = self.get_mention_prefix(mention)
-            self.on_mention(mention, prefix)
-            self.state['mention_queue'].remove(mention)
+        queue = self.state['mention_queue']
+        batch_size = self.config['mention_batch_size']
+        handled = 0
+
+        # with @cpu_bound, replies for the whole batch are worked out in
+        # parallel while they're posted in order below
+        offloaded = self._offload(self.on_mention, itertools.islice(queue, batch_size))
+
+        while len(queue) != 0 and (batch_size is None or handled < batch_size):
+            mention = queue.peek()
 
-            if self.config['autofav_mentions']:
-                self.favorite_tweet(mention)
+            if not self._seen(mention):
+                prefix = self.get_mention_prefix(mention)
+                self._run_handler(self.on_mention, mention, prefix, offloaded)
 
-            #time.sleep(self.config['reply_interval'])
+                if self.config['autofav_mentions']:
+                    self.favorite_tweet(mention)
+
+                self._mark_handled(mention)
+
+            queue.pop()
+            self.state.touch('mention_queue')
+            handled += 1
+            self.metrics.increment('twitterbot_mentions_handled_total')
+
+        self.metrics.set('twitterbot_mention_queue_depth', len(queue))
+
+
+    def mention_priority(self, tweet):
+        """
+        With config['mention_drop_policy'] set to 'priority', decides which
+        mentions are dropped first when the queue is full: the lowest
+        priority ones. By default, mentions from followers come first.
+        """
+        followers = self.state.get('followers')
+        return 1 if followers is not None and tweet.author_id in followers else 0
+
+
+    def memory_report(self):
+        """
+        Returns a list of (state key, bytes) pairs, biggest first, estimating
+        how much memory each part of the bot's state takes up.
+        """
+        report = sorted(((key, sizeof(value)) for key, value in self.state.items()),
+                key=lambda item: item[1], reverse=True)
+
+        for key, size in report:
+            self.metrics.set('twitterbot_state_bytes', size, key=key)
+
+        return report
+
+
+    def _memory_report_job(self):
+        report = self.memory_report()
+        self.logger.info('State memory: %s (%.1f KB total)',
+            ', '.join('{} {:.1f} KB'.format(key, size / 1024) for key, size in report),
+            sum(size for key, size in report) / 1024)
 
 
     def get_mention_prefix(self, tweet):
         """
         Returns a string of users to @-mention when responding to a tweet.
         """
-        mention_back = ['@' + tweet.author.screen_name]
-        mention_back += [s for s in re.split('[^@\w]', tweet.text) if len(s) > 2 and s[0] == '@' and s[1:] != self.screen_name]
-
+        followers = None
         if self.config['reply_followers_only']:
-            mention_back = [s for s in mention_back if s[1:] in self.state['followers'] or s == '@' + tweet.author.screen_name]
+            self._wait_for_graph()
+            followers = self.state.get('followers', FollowerIndex())
 
-        return ' '.join(mention_back)
+        return self.prefixer.build(tweet, followers)
+
+
+    def get_users(self, ids):
+        """
+        Returns {id: tweepy.User} for a list of user ids, looking up the ones
+        that aren't cached 100 at a time. Ids of suspended or deleted accounts
+        are left out.
+        """
+        try:
+            users = self.users.get(ids)
+        except tweepy.TweepError as e:
+            self._log_tweepy_error('Can\'t look up users', e)
+            return {}
+
+        followers = self.state.get('followers')
+        if followers is not None:
+            for user in users.values():
+                followers.remember(user.id, user.screen_name)
+
+        return users
+
+
+    def get_user(self, user_id):
+        """
+        Returns the tweepy.User for an id (or None), using get_users().
+        """
+        return self.get_users([user_id]).get(user_id)
+
+
+    def _remember_users(self, tweet):
+        """
+        Teach the follower index the screen names in a tweet, so mentions
+        without ids can still be matched to followers.
+        """
+        followers = self.state.get('followers')
+        if followers is None:
+            return
+
+        followers.remember(tweet.author_id, tweet.author_screen_name)
+        for user_id, screen_name in tweet.mentions:
+            followers.remember(user_id, screen_name)
 
 
     def _check_mentions(self):
@@ -265,24 +1260,32 @@ class TwitterBot:
         Checks mentions and loads most recent tweets into the mention queue
         """
         if self._ignore_method(self.on_mention):
-            logging.debug('Ignoring mentions')
+            self.logger.debug('Ignoring mentions')
             return
 
         try:
-            current_mentions = self.api.mentions_timeline(since_id=self.state['last_mention_id'], count=100)
+            retrieved = 0
+            dropped = 0
 
-            # direct mentions only?
-            if self.config['reply_direct_mention_only']:
-                current_mentions = [t for t in current_mentions if re.split('[^@\w]', t.text)[0] == '@' + self.screen_name]
+            for mention in self._fetch_new_tweets('mentions_timeline', 'last_mention_id', 'mention_gaps', 100):
+                # direct mentions only?
+                if self.config['reply_direct_mention_only'] and not self.direct_mention_pattern.match(mention.text):
+                    continue
 
-            if len(current_mentions) != 0:
-                self.state['last_mention_id'] = current_mentions[0].id
-            
-            self.state['last_mention_time'] = time.time()
+                self._remember_users(mention)
+                if self.state['mention_queue'].append(mention) is not None:
+                    dropped += 1
+                self.state.touch('mention_queue')
+                retrieved += 1
+
+            if dropped:
+                self.logger.warning('Mention queue is full; dropped %d mentions', dropped)
+                self.metrics.increment('twitterbot_dropped_total', dropped, key='mention_queue')
 
-            self.state['mention_queue'] += reversed(current_mentions)
+            self.state['last_mention_time'] = time.time()
 
-            logging.info('Mentions updated ({} retrieved, {} total in queue)'.format(len(current_mentions), len(self.state['mention_queue'])))
+            self.logger.info('Mentions updated (%d retrieved, %d total in queue)', retrieved, len(self.state['mention_queue']))
+            self.metrics.set('twitterbot_mention_queue_depth', len(self.state['mention_queue']))
 
         except tweepy.TweepError as e:
             self._log_tweepy_error('Can\'t retrieve mentions', e)
@@ -296,30 +1299,33 @@ class TwitterBot:
         Checks timeline and loads most recent tweets into recent timeline
         """
         if self._ignore_method(self.on_timeline):
-            logging.debug('Ignoring timeline')
+            self.logger.debug('Ignoring timeline')
             return
 
         try:
-            current_timeline = self.api.home_timeline(count=200, since_id=self.state['last_timeline_id'])
+            # remove my tweets, tweets mentioning me, and (if configured) all
+            # tweets with mentions; only the newest timeline_size are kept
+            current_timeline = deque(maxlen=self.config['timeline_size'])
+            retrieved = 0
 
-            # remove my tweets
-            current_timeline = [t for t in current_timeline if t.author.screen_name.lower() != self.screen_name.lower()]
+            for tweet in self._fetch_new_tweets('home_timeline', 'last_timeline_id', 'timeline_gaps', 200):
+                if self.timeline_filter(tweet):
+                    self._remember_users(tweet)
+                    current_timeline.append(tweet)
+                    retrieved += 1
 
-            # remove all tweets mentioning me
-            current_timeline = [t for t in current_timeline if not re.search('@'+self.screen_name, t.text, flags=re.IGNORECASE)]
+            dropped = retrieved - len(current_timeline)
+            if dropped:
+                self.logger.warning('Too many new timeline tweets; dropped the oldest %d', dropped)
+                self.metrics.increment('twitterbot_dropped_total', dropped, key='recent_timeline')
 
-            if self.config['ignore_timeline_mentions']:
-                # remove all tweets with mentions (heuristically)
-                current_timeline = [t for t in current_timeline if '@' not in t.text]
+            current_timeline = list(current_timeline)
 
-            if len(current_timeline) != 0:
-                self.state['last_timeline_id'] = current_timeline[0].id
-            
             self.state['last_timeline_time'] = time.time()
 
-            self.state['recent_timeline'] = list(reversed(current_timeline))
+            self.state['recent_timeline'] = current_timeline
 
-            logging.info('Timeline updated ({} retrieved)'.format(len(current_timeline)))
+            self.logger.info('Timeline updated (%d retrieved)', len(current_timeline))
 
         except tweepy.TweepError as e:
             self._log_tweepy_error('Can\'t retrieve timeline', e)
@@ -332,12 +1338,28 @@ class TwitterBot:
         """
         Checks followers.
         """
-        logging.info("Checking for new followers...")
+        self.logger.info('Checking for new followers...')
+        self._wait_for_graph()
 
         try:
-            self.state['new_followers'] = [f_id for f_id in self.api.followers_ids(self.id) if f_id not in self.state['followers']]
+            follower_ids = self._fetch_ids('followers_ids')
+
+            if 'followers' not in self.state:
+                # couldn't be loaded at startup, so nobody counts as new yet
+                self.state['followers'] = FollowerIndex(follower_ids)
 
-            self.config['last_follow_check'] = time.time()
+            new, lost = self.state['followers'].diff(follower_ids)
+
+            for f_id in lost:
+                self.state['followers'].discard(f_id)
+            if lost:
+                # new followers are added (and touched) by _handle_followers
+                self.state.touch('followers')
+
+            self.state['new_followers'] = new
+            self.state['last_follow_check'] = time.time()
+
+            self.logger.info('Followers updated (%d new, %d lost, %d total)', len(new), len(lost), len(self.state['followers']))
 
         except tweepy.TweepError as e:
             self._log_tweepy_error('Can\'t update followers', e)
@@ -350,8 +1372,23 @@ class TwitterBot:
         """
         Handles new followers.
         """
-        for f_id in self.state['new_followers']:
-            self.on_follow(f_id)
+        new_followers = self.state['new_followers']
+
+        # if the bot has its own on_follow, look everyone up in a few batches
+        # now, so it can call get_user() without an API call per follower
+        if new_followers and self.on_follow.__func__ is not TwitterBot.on_follow.__func__:
+            users = self.get_users(new_followers)
+        else:
+            users = {}
+
+        for f_id in new_followers:
+            self._dispatch(self.on_follow, None, f_id)
+            self.state['followers'].add(f_id)
+            if f_id in users:
+                self.state['followers'].remember(f_id, users[f_id].screen_name)
+            self.state.touch('followers')
+
+        self.state['new_followers'] = []
 
     def register_custom_handler(self, action, interval):
         """
@@ -365,86 +1402,231 @@ class TwitterBot:
 
         self.custom_handlers.append(handler)
 
-    def run(self):
+        # handlers registered once the bot is already running start right away
+        if self.scheduler is not None:
+            self._schedule_custom_handler(self.scheduler, handler)
+
+
+    def _scheduled_tweet_job(self):
+        self._dispatch(self.on_scheduled_tweet, None)
+
+        # TODO: maybe this should only run if the above is successful...
+        if self.config['tweet_interval_range'] is not None:
+            self.config['tweet_interval'] = random.randint(*self.config['tweet_interval_range'])
+
+        self.logger.info('Next tweet in %s seconds', self.config['tweet_interval'])
+        self.state['last_tweet_time'] = time.time()
+        self._save_state()
+
+        self._preload_media()
+
+        return self.config['tweet_interval']
+
+
+    def _job_name(self, action):
+        name = action if isinstance(action, basestring) else action.__name__
+        return '{}:{}'.format(self.screen_name, name)
+
+
+    def _schedule_custom_handler(self, scheduler, handler):
+        def job():
+            self._dispatch(handler['action'], None)
+            handler['last_run'] = time.time()
+            self._save_state()
+        job.__name__ = getattr(handler['action'], '__name__', 'custom_handler')
+
+        scheduler.add(job, handler['interval'], first_run=handler['last_run'] + handler['interval'],
+                name=self._job_name(job))
+
+
+    def _polls(self):
         """
-        Runs the bot! This probably shouldn't be in a "while True" lol.
+        Returns (check, handle, last-run state key, interval config key, API
+        endpoint) for each of the bot's polls.
         """
-        while True:
-            
-            # check followers every 15 minutes
-            #if self.autofollow and (time.time() - self.last_follow_check) > (15 * 60): 
-            if self.state['last_follow_check'] > (15 * 60): 
-                self._check_followers()
-                self._handle_followers()
-
-            # check mentions every minute-ish
-            #if self.reply_to_mentions and (time.time() - self.last_mention_time) > 60:
-            if (time.time() - self.state['last_mention_time']) > 60:
-                self._check_mentions()
-                self._handle_mentions()
-
-            # tweet to timeline
-            #if self.reply_to_timeline and (time.time() - self.last_mention_time) > 60:
-            if (time.time() - self.state['last_timeline_time']) > 60:
-                self._check_timeline()
-                self._handle_timeline()
-
-            # tweet to timeline on the correct interval
-            if (time.time() - self.state['last_tweet_time']) > self.config['tweet_interval']:
-                self.on_scheduled_tweet()
-
-                # TODO: maybe this should only run if the above is successful...
-                if self.config['tweet_interval_range'] is not None:
-                    self.config['tweet_interval'] = random.randint(*self.config['tweet_interval_range'])
-
-                self.log("Next tweet in {} seconds".format(self.config['tweet_interval']))
-                self.state['last_tweet_time'] = time.time()
-
-            # run custom action
-            for handler in self.custom_handlers:
-                if (time.time() - handler['last_run']) > handler['interval']:
-                    handler['action']()
-                    handler['last_run'] = time.time()
-
-            # save current state
+        timed = self._timed_phase
+        return [(timed(self._check_followers), timed(self._handle_followers), 'last_follow_check', 'follower_interval', 'followers_ids'),
+                (timed(self._check_mentions), timed(self._handle_mentions), 'last_mention_time', 'mention_interval', 'mentions_timeline'),
+                (timed(self._check_timeline), timed(self._handle_timeline), 'last_timeline_time', 'timeline_interval', 'home_timeline')]
+
+
+    def _timed_phase(self, method):
+        """
+        Wraps a check or handle method so its run time is recorded in the
+        twitterbot_phase_seconds histogram.
+        """
+        def phase():
+            with self.metrics.timer('twitterbot_phase_seconds', phase=method.__name__):
+                return method()
+        phase.__name__ = method.__name__
+        return phase
+
+
+    def _poll_job(self, check, handle, endpoint):
+        """
+        Returns a scheduler action that runs a check and its handler, then
+        saves the bot's state. If the endpoint is rate limited, the poll is
+        put off until the limit resets instead.
+        """
+        def job():
+            wait = self.governor.delay(endpoint)
+            if wait > 0:
+                self.logger.info('Putting off %s for %.0f seconds (rate limited)', check.__name__, wait)
+                return wait
+
+            check()
+            handle()
             self._save_state()
+            self._record_first_poll()
 
-            logging.info("Sleeping for a bit...")
-            time.sleep(30)
+            # if the check ran out of calls, come back when they're refilled
+            return self.governor.delay(endpoint) or None
+        job.__name__ = check.__name__
+        return job
 
 
-class FileStorage(object):
-    """
-    Default storage adapter.
+    def _record_first_poll(self):
+        if self.time_to_first_poll is None:
+            self.time_to_first_poll = time.time() - self.started_at
+            self.logger.info('First poll finished %.2f seconds after startup', self.time_to_first_poll)
 
-    Adapters must implement two methods: read(name) and write(name).
-    """
+
+    def _concurrent_poll_job(self):
+        """
+        Returns a scheduler action that starts every poll that is due,
+        fetching from the API concurrently on self.pool. It doesn't wait for
+        them: as each check finishes, its handler is scheduled to run in the
+        scheduler's thread, so handlers still run one after another, and
+        one slow bot doesn't hold up the others sharing the scheduler.
+        """
+        polls = self._polls()
+        next_due = dict((check, self.state[last_key] + self.config[interval_key])
+                for check, handle, last_key, interval_key, endpoint in polls)
+        running = {}
+
+        def finished(check, handle, endpoint, future):
+            def job():
+                del running[check]
+                future.result()
+                handle()
+                self._save_state()
+                self._record_first_poll()
+
+                # if the check ran out of calls, come back when they're refilled
+                wait = self.governor.delay(endpoint)
+                if wait > 0:
+                    next_due[check] = time.time() + wait
+            job.__name__ = handle.__name__
+
+            future.add_done_callback(lambda done: self.scheduler.add_once(job, name=self._job_name(job)))
+
+        def poll():
+            now = time.time()
+
+            for check, handle, last_key, interval_key, endpoint in polls:
+                if check in running or next_due[check] > now:
+                    continue
+
+                wait = self.governor.delay(endpoint)
+                if wait > 0:
+                    self.logger.info('Putting off %s for %.0f seconds (rate limited)', check.__name__, wait)
+                    next_due[check] = now + wait
+                    continue
+
+                future = running[check] = self.pool.submit(check)
+                self.poll_futures.add(future)
+                future.add_done_callback(self.poll_futures.discard)
+                next_due[check] = now + self.config[interval_key]
+                finished(check, handle, endpoint, future)
+
+            return max(min(next_due.values()) - time.time(), 0)
+
+        return poll
 
 
-    def read(self, name):
+    def schedule(self, scheduler, concurrent=False):
         """
-        Return an IO-like object that will produce binary data when read from.
-        If nothing is stored under the given name, raise IOError.
+        Add all of the bot's recurring jobs to a Scheduler. Each job picks up
+        where the saved state left off, so a restarted bot doesn't redo work
+        that isn't due yet.
+
+        With concurrent=True, polls that come due together hit the API at the
+        same time on self.pool instead of one after another.
         """
-        filename = self._get_filename(name)
-        if os.path.exists(filename):
-            logging.debug("Reading from {}".format(filename))
+        self.scheduler = scheduler
+
+        if self.config['cpu_workers'] > 0:
+            # warm the workers up before the first mention comes in
+            self._start_cpu_pool()
+
+        if concurrent:
+            scheduler.add(self._concurrent_poll_job(), 0, first_run=time.time(), name=self._job_name('poll'))
         else:
-            logging.debug("{} doesn't exist".format(filename))
-        return open(filename)
+            for check, handle, last_key, interval_key, endpoint in self._polls():
+                scheduler.add(self._poll_job(check, handle, endpoint), self.config[interval_key],
+                        first_run=self.state[last_key] + self.config[interval_key],
+                        name=self._job_name(check))
+
+        scheduler.add(self._scheduled_tweet_job, self.config['tweet_interval'],
+                first_run=self.state['last_tweet_time'] + self.config['tweet_interval'],
+                name=self._job_name(self.on_scheduled_tweet))
+
+        for handler in self.custom_handlers:
+            self._schedule_custom_handler(scheduler, handler)
+
+        if self.config['memory_report_interval'] is not None:
+            scheduler.add(self._memory_report_job, self.config['memory_report_interval'],
+                    name=self._job_name('memory_report'))
 
+        # replies still waiting from the last run
+        if len(self.state['pending_replies']) != 0:
+            with self.reply_lock:
+                self._start_reply_job()
 
-    def write(self, name):
+        self._preload_media()
+
+
+    def run(self):
         """
-        Return an IO-like object that will store binary data written to it.
+        Runs the bot! Sleeps until the next job is due, runs it, and repeats.
         """
-        filename = self._get_filename(name)
-        if os.path.exists(filename):
-            logging.debug("Overwriting {}".format(filename))
-        else:
-            logging.debug("Creating {}".format(filename))
-        return open(filename, 'wb')
+        try:
+            self.schedule(Scheduler())
+            self.scheduler.run()
+        finally:
+            self.shutdown()
+
+
+    def run_async(self, workers=3):
+        """
+        Runs the bot like run(), but checks mentions, the timeline and
+        followers concurrently, so a round of polling takes as long as the
+        slowest API call instead of all of them added up. Handlers still run
+        one at a time, so on_mention and friends don't need to be thread-safe.
+        """
+        self.pool = WorkerPool(workers)
+
+        try:
+            self.schedule(Scheduler(), concurrent=True)
+            self.scheduler.run()
+        finally:
+            self.pool.shutdown()
+            self.shutdown()
+
+
+    def shutdown(self):
+        """
+        Wait for any outbound actions still in flight, then save state.
+        Hosted bots leave the shared actions to the host, which shuts them
+        down before calling this.
+        """
+        self._stop_cpu_pool()
+
+        if self.actions is not None and self.host is None:
+            self.logger.info('Waiting for pending actions to finish...')
+            self.actions.shutdown()
 
+        self._save_state()
 
-    def _get_filename(self, name):
-        return '{}_state.pkl'.format(name)
+        if self.log_listener is not None:
+            self.log_listener.stop()
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*- #
+#
+# corpus.py
+# ---------
+
+from __future__ import division
+from __future__ import unicode_literals
+
+import hashlib
+import io
+import mmap
+import os
+import random
+import struct
+import tempfile
+
+
+# index file layout: magic, then (corpus size, corpus mtime, line count),
+# padded to HEADER_SIZE, then one little-endian uint64 offset per line
+INDEX_MAGIC = b'TWBCRPS1'
+INDEX_HEADER = struct.Struct(b'<QdQ')
+INDEX_HEADER_SIZE = 64
+OFFSET = struct.Struct(b'<Q')
+
+
+class Corpus(object):
+    """
+    A big text file of lines (words, sentences...) to pick from at random,
+    without reading it all into memory.
+
+    The file is memory-mapped, along with an index of where each non-blank
+    line starts, so picking a line is O(1) and the operating system shares
+    both between every bot and process using the same corpus. The index is
+    built the first time a file is used and cached on disk (in
+    ~/.cache/twitterbot, or $XDG_CACHE_HOME/twitterbot, unless index_path
+    says otherwise); it's rebuilt if the file changes. If the cache can't be
+    written, the index is kept in memory instead.
+
+        words = Corpus('/usr/share/dict/words')
+        words.random_line()
+        words.random_line(where=lambda w: w.startswith('b'))
+        words.sample(3)
+
+    Lines come back as unicode, decoded with encoding.
+    """
+
+    def __init__(self, path, index_path=None, encoding='utf-8', rng=None):
+        self.path = path
+        self.encoding = encoding
+        self.random = rng or random
+
+        if index_path is None:
+            key = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:16]
+            index_path = os.path.join(_cache_dir(), 'corpus-{}.idx'.format(key))
+        self.index_path = index_path
+
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.size = stat.st_size
+            self.buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b''
+
+        self.index, self.count = self._open_index(stat.st_mtime)
+
+
+    def __len__(self):
+        return self.count
+
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('corpus line out of range')
+
+        start = OFFSET.unpack_from(self.index, INDEX_HEADER_SIZE + i * OFFSET.size)[0]
+        end = self.buf.find(b'\n', start)
+        if end == -1:
+            end = self.size
+
+        return self.buf[start:end].rstrip(b'\r').decode(self.encoding)
+
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+
+    def random_line(self, where=None, tries=1000):
+        """
+        Returns a random line. If where is given, returns a random line for
+        which where(line) is true, or None if there aren't any.
+
+        Lines are drawn at random until one matches, so rare matches fall
+        back to scanning the whole corpus after `tries` misses.
+        """
+        if self.count == 0:
+            return None
+
+        if where is None:
+            return self[self.random.randrange(self.count)]
+
+        for _ in range(tries):
+            line = self[self.random.randrange(self.count)]
+            if where(line):
+                return line
+
+        matches = self.sample(1, where, tries=0)
+        return matches[0] if matches else None
+
+
+    def sample(self, k, where=None, tries=None):
+        """
+        Returns up to k different random lines (for which where(line) is
+        true, if where is given). Draws at random for up to `tries` attempts
+        (100 per line asked for, by default), then scans the whole corpus
+        for the rest.
+        """
+        if tries is None:
+            tries = k * 100
+
+        picked = set()
+        lines = []
+
+        for _ in range(tries):
+            if len(lines) == k or len(picked) == self.count:
+                return lines
+
+            i = self.random.randrange(self.count)
+            if i in picked:
+                continue
+            picked.add(i)
+
+            line = self[i]
+            if where is None or where(line):
+                lines.append(line)
+
+        if len(lines) < k:
+            rest = [i for i in range(self.count) if i not in picked]
+            self.random.shuffle(rest)
+            for i in rest:
+                line = self[i]
+                if where is None or where(line):
+                    lines.append(line)
+                    if len(lines) == k:
+                        break
+
+        return lines
+
+
+    def close(self):
+        if self.size:
+            self.buf.close()
+        if isinstance(self.index, mmap.mmap):
+            self.index.close()
+
+
+    def _open_index(self, mtime):
+        """
+        Maps the cached index, building it first if it's missing or stale.
+        Returns (index buffer, line count).
+        """
+        try:
+            with open(self.index_path, 'rb') as f:
+                header = f.read(INDEX_HEADER_SIZE)
+                if header[:len(INDEX_MAGIC)] == INDEX_MAGIC:
+                    size, index_mtime, count = INDEX_HEADER.unpack_from(header, len(INDEX_MAGIC))
+                    if (size, index_mtime) == (self.size, mtime):
+                        return self._map_index(f, count)
+        except (IOError, OSError, struct.error):
+            pass
+
+        try:
+            self._build_index(mtime)
+
+            with open(self.index_path, 'rb') as f:
+                count = INDEX_HEADER.unpack_from(f.read(INDEX_HEADER_SIZE), len(INDEX_MAGIC))[2]
+                return self._map_index(f, count)
+
+        except (IOError, OSError):
+            # the cache directory isn't writable (or the cached index
+            # belongs to another user), so this process keeps its own copy
+            f = io.BytesIO()
+            count = self._write_index(f, mtime)
+            return f.getvalue(), count
+
+
+    def _map_index(self, f, count):
+        if count == 0:
+            return b'', 0
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), count
+
+
+    def _build_index(self, mtime):
+        directory = os.path.dirname(os.path.abspath(self.index_path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # written next to the real index and renamed into place, so another
+        # process never sees half an index
+        fd, tmp_path = tempfile.mkstemp(dir=directory)
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                self._write_index(f, mtime)
+            os.rename(tmp_path, self.index_path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+
+    def _write_index(self, f, mtime):
+        """
+        Writes the index to a file-like object. Returns the line count.
+        """
+        count = 0
+        f.write(b'\0' * INDEX_HEADER_SIZE)
+
+        start = 0
+        while start < self.size:
+            end = self.buf.find(b'\n', start)
+            if end == -1:
+                end = self.size
+
+            if self.buf[start:end].strip():
+                f.write(OFFSET.pack(start))
+                count += 1
+
+            start = end + 1
+
+        f.seek(0)
+        f.write(INDEX_MAGIC + INDEX_HEADER.pack(self.size, mtime, count))
+        return count
+
+
+def _cache_dir():
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'twitterbot')
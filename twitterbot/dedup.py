@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*- #
+#
+# dedup.py
+# --------
+
+from __future__ import unicode_literals
+
+import threading
+
+from collections import OrderedDict
+
+
+class SeenTweets(object):
+    """
+    Remembers the ids of the last `capacity` tweets the bot acted on.
+
+    Checking an id moves it to the back of the line, so ids that keep coming
+    up stay remembered and the oldest ones are forgotten first. Memory use
+    stays the same no matter how long the bot runs.
+
+    Safe to use from action worker threads while the state is being saved.
+    """
+
+    def __init__(self, capacity=2000, ids=()):
+        self.capacity = capacity
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
+
+        for tweet_id in ids:
+            self.add(tweet_id)
+
+
+    def __contains__(self, tweet_id):
+        with self.lock:
+            if tweet_id not in self.ids:
+                return False
+            del self.ids[tweet_id]
+            self.ids[tweet_id] = True
+            return True
+
+
+    def __len__(self):
+        return len(self.ids)
+
+
+    def add(self, tweet_id):
+        with self.lock:
+            self.ids.pop(tweet_id, None)
+            self.ids[tweet_id] = True
+
+            while len(self.ids) > self.capacity:
+                self.ids.popitem(last=False)
+
+
+    def __getstate__(self):
+        with self.lock:
+            return {'capacity': self.capacity, 'ids': list(self.ids)}
+
+
+    def __setstate__(self, state):
+        self.__init__(state['capacity'], state['ids'])
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*- #
+#
+# executor.py
+# -----------
+
+from __future__ import unicode_literals
+
+import logging
+import threading
+import Queue
+
+from collections import deque
+
+
+class Future(object):
+    """
+    Handle for the result of a call running on a WorkerPool.
+    """
+
+    def __init__(self):
+        self._finished = threading.Event()
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+
+    def done(self):
+        return self._finished.is_set()
+
+
+    def result(self, timeout=None):
+        """
+        Wait for the call to finish and return its result, re-raising any
+        exception it raised.
+        """
+        if not self._finished.wait(timeout):
+            raise RuntimeError('Timed out waiting for result')
+
+        if self._exception is not None:
+            raise self._exception
+        return self._result
+
+
+    def exception(self, timeout=None):
+        """
+        Wait for the call to finish and return the exception it raised, or
+        None if it succeeded.
+        """
+        if not self._finished.wait(timeout):
+            raise RuntimeError('Timed out waiting for result')
+        return self._exception
+
+
+    def add_done_callback(self, callback):
+        """
+        Call callback(future) once the call finishes (right away if it
+        already has).
+        """
+        with self._lock:
+            if not self._finished.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._finish()
+
+
+    def _finish(self):
+        with self._lock:
+            self._finished.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                logging.exception('Error in future callback')
+
+
+class WorkerPool(object):
+    """
+    A fixed number of daemon threads running calls from a shared queue.
+    """
+
+    def __init__(self, workers=4, name='twitterbot-worker'):
+        self.tasks = Queue.Queue()
+        self.threads = []
+
+        for i in range(workers):
+            thread = threading.Thread(target=self._work, name='{}-{}'.format(name, i))
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) on a worker thread. Returns a Future.
+        """
+        future = Future()
+        self.tasks.put((future, fn, args, kwargs))
+        return future
+
+
+    def shutdown(self, wait=True):
+        """
+        Stop the workers once everything already submitted has run.
+        """
+        for thread in self.threads:
+            self.tasks.put(None)
+
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+
+    def _work(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return
+
+            future, fn, args, kwargs = task
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+
+
+class ActionExecutor(object):
+    """
+    Runs outbound actions (posting, faving, following) on a WorkerPool.
+
+    Actions submitted with the same key run one at a time, in the order they
+    were submitted; actions with different keys (or no key) run in parallel.
+    """
+
+    def __init__(self, workers=4):
+        self.pool = WorkerPool(workers, name='twitterbot-action')
+        self.lanes = {}
+        self.outstanding = 0
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+
+
+    def submit(self, key, fn, *args, **kwargs):
+        """
+        Run fn(*args, **kwargs) after any earlier action with the same key
+        has finished. Returns a Future.
+        """
+        task = (Future(), fn, args, kwargs)
+
+        with self.lock:
+            self.outstanding += 1
+
+            if key is not None:
+                if key in self.lanes:
+                    self.lanes[key].append(task)
+                    return task[0]
+                self.lanes[key] = deque()
+
+        self._start(key, task)
+        return task[0]
+
+
+    def _start(self, key, task):
+        future, fn, args, kwargs = task
+        self.pool.submit(fn, *args, **kwargs).add_done_callback(
+                lambda inner: self._finish(key, future, inner))
+
+
+    def _finish(self, key, future, inner):
+        next_task = None
+
+        with self.lock:
+            if key is not None:
+                if self.lanes[key]:
+                    next_task = self.lanes[key].popleft()
+                else:
+                    del self.lanes[key]
+
+        if next_task is not None:
+            self._start(key, next_task)
+
+        if inner.exception() is not None:
+            future.set_exception(inner.exception())
+        else:
+            future.set_result(inner.result())
+
+        with self.lock:
+            self.outstanding -= 1
+            if self.outstanding == 0:
+                self.idle.notify_all()
+
+
+    def shutdown(self, wait=True):
+        """
+        Wait for every submitted action to finish, then stop the workers.
+        """
+        if wait:
+            with self.lock:
+                while self.outstanding != 0:
+                    self.idle.wait()
+
+        self.pool.shutdown(wait)
@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*- #
+#
+# fake.py
+# -------
+
+from __future__ import division
+from __future__ import unicode_literals
+
+import bisect
+import itertools
+import random
+import threading
+import time
+
+from tweepy.error import TweepError
+from tweepy.models import Media, Status, User
+from tweepy.parsers import ModelParser
+
+from twitterbot.ratelimit import ENDPOINTS, DEFAULT_WINDOW
+
+
+WORDS = ['fart', 'butt', 'hello', 'bot', 'what', 'is', 'this', 'lol', 'cool',
+        'wow', 'please', 'reply', 'to', 'me', 'echo', 'wanna', 'hear', 'u']
+
+
+class FakeResponse(object):
+    """
+    Stands in for the requests response tweepy keeps as api.last_response.
+    """
+
+    def __init__(self, url, headers):
+        self.url = url
+        self.headers = headers
+        self.status_code = 200
+
+
+class FakeAPI(object):
+    """
+    In-process stand-in for the parts of tweepy.API a TwitterBot uses, for
+    trying out and benchmarking bots without talking to Twitter.
+
+    Mentions and home timeline tweets arrive at mention_rate and
+    timeline_rate per second, generated as they're asked for, from random
+    users (a follower_ratio share of them followers). replay() feeds
+    recorded tweets in at the same rate instead. Everything the bot posts,
+    favs and follows is kept, along with how long each reply took to come
+    back after the mention it answers.
+
+        api = FakeAPI(followers=5000, mention_rate=50)
+        ...
+        self.config['api'] = api
+
+    latency adds that many seconds to every call, to stand in for the
+    network.
+    """
+
+    parser = ModelParser()
+
+    def __init__(self, screen_name='fakebot', user_id=1, followers=1000, friends=100,
+            mention_rate=1, timeline_rate=1, follower_ratio=0.5, latency=0,
+            keep=5000, clock=time.time, seed=None):
+        self.screen_name = screen_name
+        self.user_id = user_id
+        self.followers = list(range(10, 10 + followers))
+        self.friends = list(range(10, 10 + friends))
+        self.mention_rate = mention_rate
+        self.timeline_rate = timeline_rate
+        self.follower_ratio = follower_ratio
+        self.latency = latency
+        self.keep = keep
+        self.clock = clock
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.next_id = itertools.count(10 ** 9)
+        self.streams = {
+            'mentions_timeline': ([], [], clock()),
+            'home_timeline': ([], [], clock()),
+        }
+        self.replayed = None
+
+        self.created = {}
+        self.posted = []
+        self.uploaded = []
+        self.chunked = {}
+        self.posted_media = []
+        self.favorited = []
+        self.followed = []
+        self.reply_latencies = []
+        self.calls = {}
+        self.last_response = None
+
+
+    def replay(self, tweets):
+        """
+        Use recorded tweets (an iterable of tweet JSON dicts) as mentions
+        instead of generating them. Each gets a fresh id as it arrives.
+        """
+        self.replayed = iter(tweets)
+
+
+    def _call(self, endpoint):
+        with self.lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        headers = {
+            'x-rate-limit-remaining': '1000',
+            'x-rate-limit-reset': str(int(self.clock() + DEFAULT_WINDOW)),
+        }
+        self.last_response = FakeResponse('https://api.twitter.com/1.1' + ENDPOINTS.get(endpoint, '/' + endpoint), headers)
+
+
+    def _user(self, user_id):
+        if user_id == self.user_id:
+            return {'id': user_id, 'screen_name': self.screen_name}
+        return {'id': user_id, 'screen_name': 'user{}'.format(user_id)}
+
+
+    def _random_user(self):
+        if self.followers and self.random.random() < self.follower_ratio:
+            return self._user(self.random.choice(self.followers))
+        return self._user(self.random.randint(10 ** 6, 10 ** 7))
+
+
+    def _tweet_json(self, mention):
+        if mention and self.replayed is not None:
+            tweet = next(self.replayed, None)
+            if tweet is not None:
+                return dict(tweet)
+
+        user = self._random_user()
+        words = [self.random.choice(WORDS) for _ in range(self.random.randint(3, 12))]
+        mentions = []
+
+        if mention:
+            mentions.append({'id': self.user_id, 'screen_name': self.screen_name})
+            if self.random.random() < 0.2:
+                mentions.append(self._random_user())
+            words = ['@' + m['screen_name'] for m in mentions] + words
+
+        return {
+            'text': ' '.join(words),
+            'user': user,
+            'entities': {'user_mentions': mentions},
+            'in_reply_to_status_id': None,
+            'in_reply_to_user_id': None,
+            'in_reply_to_screen_name': None,
+            'created_at': time.strftime('%a %b %d %H:%M:%S +0000 %Y', time.gmtime(self.clock())),
+        }
+
+
+    def _arrive(self, endpoint):
+        """
+        Generate the tweets that came in on a stream since it was last
+        checked.
+        """
+        rate = self.mention_rate if endpoint == 'mentions_timeline' else self.timeline_rate
+        ids, tweets, since = self.streams[endpoint]
+        now = self.clock()
+
+        arrived = int((now - since) * rate)
+        if arrived == 0:
+            return
+
+        for _ in range(arrived):
+            tweet = self._tweet_json(endpoint == 'mentions_timeline')
+            tweet['id'] = next(self.next_id)
+            ids.append(tweet['id'])
+            tweets.append(Status.parse(self, tweet))
+            self.created[tweet['id']] = now
+
+        if len(ids) > self.keep:
+            for old_id in ids[:-self.keep]:
+                self.created.pop(old_id, None)
+            del ids[:-self.keep]
+            del tweets[:-self.keep]
+
+        # carry over the fraction of a tweet that hasn't arrived yet
+        self.streams[endpoint] = (ids, tweets, since + arrived / rate)
+
+
+    def _timeline(self, endpoint, since_id=None, max_id=None, count=20):
+        self._call(endpoint)
+
+        with self.lock:
+            self._arrive(endpoint)
+            ids, tweets, _ = self.streams[endpoint]
+
+            start = 0 if since_id is None else bisect.bisect_right(ids, since_id)
+            end = len(ids) if max_id is None else bisect.bisect_right(ids, max_id)
+            start = max(start, end - count)
+
+            return tweets[start:end][::-1]
+
+
+    def _ids(self, endpoint, ids, cursor):
+        self._call(endpoint)
+
+        # cursors are offsets into the list; 0 means there are no more pages
+        start = 0 if cursor == -1 else cursor
+        end = start + 5000
+        return ids[start:end], (start, end if end < len(ids) else 0)
+
+
+    def me(self):
+        self._call('me')
+        return User.parse(self, {'id': self.user_id, 'screen_name': self.screen_name})
+
+
+    def mentions_timeline(self, since_id=None, max_id=None, count=20, **kwargs):
+        return self._timeline('mentions_timeline', since_id, max_id, count)
+
+
+    def home_timeline(self, since_id=None, max_id=None, count=20, **kwargs):
+        return self._timeline('home_timeline', since_id, max_id, count)
+
+
+    def followers_ids(self, id=None, cursor=-1, **kwargs):
+        return self._ids('followers_ids', self.followers, cursor)
+
+
+    def friends_ids(self, id=None, cursor=-1, **kwargs):
+        return self._ids('friends_ids', self.friends, cursor)
+
+
+    def lookup_users(self, user_ids=None, screen_names=None, **kwargs):
+        self._call('lookup_users')
+        # ids in the range _random_user() draws from exist; others don't
+        return [User.parse(self, self._user(user_id)) for user_id in (user_ids or [])[:100]
+                if 10 <= user_id < 10 ** 7 + 1]
+
+
+    def media_upload(self, filename, file=None, **kwargs):
+        self._call('media_upload')
+        data = file.read() if file is not None else open(filename, 'rb').read()
+        with self.lock:
+            self.uploaded.append((filename, len(data)))
+            media_id = next(self.next_id)
+        return Media.parse(self, {'media_id': media_id, 'expires_after_secs': 86400})
+
+
+    def media_upload_init(self, total_bytes, media_type, media_category=None, **kwargs):
+        self._call('media_upload_init')
+        with self.lock:
+            media_id = next(self.next_id)
+            self.chunked[media_id] = (total_bytes, [])
+        return Media.parse(self, {'media_id': media_id, 'expires_after_secs': 86400})
+
+
+    def media_upload_append(self, media_id, segment_index, chunk, **kwargs):
+        self._call('media_upload_append')
+        with self.lock:
+            self.chunked[media_id][1].append((segment_index, len(chunk)))
+
+
+    def media_upload_finalize(self, media_id, **kwargs):
+        self._call('media_upload_finalize')
+        with self.lock:
+            total_bytes, segments = self.chunked.pop(media_id)
+            size = sum(length for _, length in sorted(segments))
+            if size != total_bytes:
+                raise TweepError('Expected {} bytes, got {}'.format(total_bytes, size))
+            # chunked uploads don't send a filename
+            self.uploaded.append((None, size))
+        return Media.parse(self, {'media_id': media_id, 'size': size, 'expires_after_secs': 86400})
+
+
+    def update_status(self, status, in_reply_to_status_id=None, **kwargs):
+        self._call('update_status')
+        if kwargs.get('media_ids'):
+            self.posted_media.append(list(kwargs['media_ids']))
+        return self._posted(status, in_reply_to_status_id)
+
+
+    def _posted(self, text, in_reply_to_status_id):
+        with self.lock:
+            now = self.clock()
+            self.posted.append((text, in_reply_to_status_id))
+
+            created = self.created.get(in_reply_to_status_id)
+            if created is not None:
+                self.reply_latencies.append(now - created)
+
+            return Status.parse(self, {
+                'id': next(self.next_id),
+                'text': text,
+                'user': self._user(self.user_id),
+                'entities': {'user_mentions': []},
+                'in_reply_to_status_id': in_reply_to_status_id,
+                'created_at': time.strftime('%a %b %d %H:%M:%S +0000 %Y', time.gmtime(now)),
+            })
+
+
+    def create_favorite(self, id, **kwargs):
+        self._call('create_favorite')
+        self.favorited.append(id)
+
+
+    def create_friendship(self, id=None, **kwargs):
+        self._call('create_friendship')
+        self.followed.append(id)
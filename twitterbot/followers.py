@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*- #
+#
+# followers.py
+# ------------
+
+from __future__ import unicode_literals
+
+
+class FollowerIndex(object):
+    """
+    Set-backed index of Twitter user ids.
+
+    The bot keeps one of these for its followers and one for its friends.
+    Membership checks are O(1), and diff() compares a fresh list of ids from
+    the API against the index in a single pass.
+
+    The index also remembers the screen names of members it has been told
+    about (see remember()), so has_screen_name() can answer "is @someone a
+    follower?" without an API call. version goes up whenever the members,
+    or the screen names known for them, change.
+    """
+
+    def __init__(self, ids=None):
+        self.ids = set(ids or [])
+        self.names = {}
+        self.screen_names = {}
+        self.version = 0
+
+
+    def __setstate__(self, state):
+        # indexes saved by older versions only had ids
+        self.__dict__.update(state)
+        self.__dict__.setdefault('names', {})
+        self.__dict__.setdefault('screen_names', {})
+        self.__dict__.setdefault('version', 0)
+
+
+    def __contains__(self, user_id):
+        return user_id in self.ids
+
+
+    def __iter__(self):
+        return iter(self.ids)
+
+
+    def __len__(self):
+        return len(self.ids)
+
+
+    def add(self, user_id):
+        if user_id not in self.ids:
+            self.ids.add(user_id)
+            self.version += 1
+
+
+    def discard(self, user_id):
+        if user_id in self.ids:
+            self.ids.discard(user_id)
+            self._forget(user_id)
+            self.version += 1
+
+
+    def remember(self, user_id, screen_name):
+        """
+        Record the screen name of a member. Users who aren't members are
+        ignored, so this can be called for everyone the bot comes across.
+        """
+        if user_id not in self.ids:
+            return
+
+        name = screen_name.lower()
+        old_name = self.screen_names.get(user_id)
+        if old_name == name:
+            return
+
+        if old_name is not None:
+            self.names.pop(old_name, None)
+        self.names[name] = user_id
+        self.screen_names[user_id] = name
+        self.version += 1
+
+
+    def has_screen_name(self, screen_name):
+        """
+        Returns True if the user with this screen name is a member, as far as
+        the index knows.
+        """
+        user_id = self.names.get(screen_name.lower())
+        return user_id is not None and user_id in self.ids
+
+
+    def _forget(self, user_id):
+        name = self.screen_names.pop(user_id, None)
+        if name is not None:
+            self.names.pop(name, None)
+
+
+    def diff(self, ids):
+        """
+        Compare a list of ids against the index without changing it.
+
+        Returns a (new, lost) tuple: new is a list of ids that aren't in the
+        index yet, in the order they were given; lost is a set of indexed ids
+        that are no longer present.
+        """
+        current = set(ids)
+        new = [user_id for user_id in ids if user_id not in self.ids]
+        lost = self.ids - current
+        return new, lost
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*- #
+#
+# host.py
+# -------
+
+from __future__ import unicode_literals
+
+import imp
+import logging
+import sys
+
+from twitterbot.executor import ActionExecutor, WorkerPool
+from twitterbot.logs import log_handler
+from twitterbot.metrics import Metrics
+from twitterbot.scheduler import Scheduler
+
+
+class BotHost(object):
+    """
+    Runs many TwitterBots in one process.
+
+    All hosted bots share one scheduler, one thread pool for polling and one
+    for outbound actions, so an idle bot costs a few heap entries instead of
+    a whole process. Each bot still has its own state, storage and log file.
+
+    Because actions are shared, post_tweet and favorite_tweet return Futures
+    for hosted bots (as they do with config['action_workers'] set).
+
+    Every bot's metrics go in one registry, labelled with the bot's screen
+    name, and are served at http://localhost:<metrics_port>/metrics if a
+    port is given.
+    """
+
+    def __init__(self, poll_workers=4, action_workers=8, log_file='twitterbot-host.log', logging_level=logging.INFO,
+            metrics_port=None, log_max_bytes=10 * 1024 * 1024, log_backup_count=5, log_json=False):
+        handler, self.log_listener = log_handler(log_file, max_bytes=log_max_bytes,
+                backup_count=log_backup_count, json_lines=log_json)
+        root = logging.getLogger()
+        root.addHandler(handler)
+        root.setLevel(logging_level)
+
+        self.metrics = Metrics()
+        if metrics_port is not None:
+            self.metrics.serve(metrics_port)
+
+        self.scheduler = Scheduler(on_error=self._job_failed)
+        self.pool = WorkerPool(poll_workers, name='twitterbot-poll')
+        self.actions = ActionExecutor(action_workers)
+        self.bots = []
+
+
+    def add(self, bot_class):
+        """
+        Create a bot from a TwitterBot subclass and host it. Returns the bot.
+        """
+        bot = bot_class(host=self)
+        self.bots.append(bot)
+        logging.info('Hosting %s (%s)', bot.screen_name, bot_class.__name__)
+        return bot
+
+
+    def load(self, path, class_name):
+        """
+        Import a bot class from a Python file and host it. Returns the bot.
+        Log and state files go in the host's working directory, same as when
+        running a bot on its own.
+        """
+        module = imp.load_source('twitterbot_hosted_{}'.format(len(self.bots)), path)
+        return self.add(getattr(module, class_name))
+
+
+    def run(self):
+        """
+        Run every hosted bot until interrupted.
+        """
+        for bot in self.bots:
+            bot.schedule(self.scheduler, concurrent=True)
+
+        logging.info('Running %d bots', len(self.bots))
+
+        try:
+            self.scheduler.run()
+        finally:
+            self.shutdown()
+
+
+    def shutdown(self):
+        """
+        Stop scheduling, wait for pending actions, then shut every bot down
+        (stopping its worker processes, saving its state and finishing its
+        log) and finish writing the host's log.
+        """
+        self.scheduler.stop()
+        self.actions.shutdown()
+        self.pool.shutdown()
+
+        for bot in self.bots:
+            bot.shutdown()
+
+        self.log_listener.stop()
+
+
+    def _job_failed(self, job, e):
+        # one bot's bug shouldn't take down every other bot in the process
+        logging.exception('Job %s failed', job.name)
+
+
+def main(argv):
+    """
+    python -m twitterbot.host path/to/fartbot.py:FartBot path/to/echobot.py:EchoBot
+    """
+    if len(argv) < 2:
+        sys.exit('Usage: python -m twitterbot.host FILE:CLASS [FILE:CLASS ...]')
+
+    host = BotHost()
+    for spec in argv[1:]:
+        path, class_name = spec.rsplit(':', 1)
+        host.load(path, class_name)
+
+    host.run()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
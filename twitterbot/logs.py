@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*- #
+#
+# logs.py
+# -------
+
+from __future__ import unicode_literals
+
+import atexit
+import json
+import logging
+import logging.handlers
+import threading
+import time
+
+from Queue import Queue, Full
+
+
+LOG_FORMAT = '%(asctime)s | %(levelname)s: %(message)s'
+LOG_DATE_FORMAT = '%m/%d/%Y %I:%M:%S %p'
+
+# max number of log records waiting to be written; past this, new ones are
+# dropped rather than holding up the bot
+LOG_QUEUE_SIZE = 10000
+
+
+class QueueHandler(logging.Handler):
+    """
+    Puts log records on a queue for a QueueListener's writer thread instead
+    of writing them, so logging from the bot's threads never waits on the
+    disk. The queue can be a multiprocessing.Queue, to send records from
+    worker processes to a listener in the main one.
+
+    The message is formatted here (arguments can change once the call
+    returns); timestamps, layout and I/O happen on the writer thread. If
+    the queue is full the record is dropped and counted in `dropped`.
+    """
+
+    def __init__(self, queue):
+        logging.Handler.__init__(self)
+        self.queue = queue
+        self.dropped = 0
+
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # tracebacks hold on to frames, so render them now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+    def emit(self, record):
+        try:
+            self.queue.put_nowait(self.prepare(record))
+        except Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+
+class QueueListener(object):
+    """
+    Writes log records from a queue (a new one, unless one is given) to
+    handlers on a background thread. stop() (which also runs at exit)
+    writes whatever is still queued.
+    """
+
+    def __init__(self, handlers, queue=None):
+        self.handlers = handlers
+        self.queue = queue if queue is not None else Queue(LOG_QUEUE_SIZE)
+        self.thread = None
+        self.lock = threading.Lock()
+
+
+    def start(self):
+        self.thread = threading.Thread(target=self._write, name='twitterbot-log')
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.stop)
+
+
+    def stop(self):
+        with self.lock:
+            thread, self.thread = self.thread, None
+
+        if thread is not None:
+            # blocks if the queue is full, which is fine: nothing else is
+            # waiting on us at this point
+            self.queue.put(None)
+            thread.join()
+
+            for handler in self.handlers:
+                handler.flush()
+
+
+    def handle(self, record):
+        for handler in self.handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
+    def _write(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            self.handle(record)
+
+
+class RelayHandler(logging.Handler):
+    """
+    Passes records on to the logger they were logged to (in this process),
+    for records that came from worker processes through a QueueListener.
+    """
+
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats records as one JSON object per line, for log shippers and jq:
+
+        {"time": "2016-05-01T12:00:00.123Z", "level": "INFO",
+         "logger": "twitterbot.fartbot", "message": "Tweeting \"pfffft\""}
+
+    Exceptions go in "exception".
+    """
+
+    def format(self, record):
+        entry = {
+            'time': '{}.{:03d}Z'.format(time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)), int(record.msecs)),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+
+        return json.dumps(entry, ensure_ascii=False, sort_keys=True)
+
+
+def log_handler(filename, max_bytes=None, backup_count=5, rotate_when=None, json_lines=False, background=True):
+    """
+    Returns (handler, listener): a handler that writes to filename,
+    rotating it every rotate_when ('midnight', 'H', ... as for
+    TimedRotatingFileHandler) or else once it reaches max_bytes (if set),
+    keeping backup_count old files.
+
+    With background set, the handler is a QueueHandler and the listener is
+    the started QueueListener that does the writing; stop it to flush.
+    Otherwise the listener is None and the handler writes directly.
+    """
+    if rotate_when is not None:
+        handler = logging.handlers.TimedRotatingFileHandler(filename, when=rotate_when,
+                backupCount=backup_count, encoding='utf-8')
+    elif max_bytes:
+        handler = logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes,
+                backupCount=backup_count, encoding='utf-8')
+    else:
+        handler = logging.FileHandler(filename, encoding='utf-8')
+
+    if json_lines:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+
+    if not background:
+        return handler, None
+
+    listener = QueueListener([handler])
+    listener.start()
+    return QueueHandler(listener.queue), listener
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*- #
+#
+# matching.py
+# -----------
+
+from __future__ import unicode_literals
+
+import re
+
+
+class KeywordMatcher(object):
+    """
+    Checks text for any of a set of keywords in a single pass.
+
+    Text is lowercased and split on whitespace, and each word is looked up in
+    a set, so the cost depends on the length of the tweet rather than on the
+    number of keywords. Keywords with spaces in them are matched as phrases
+    of consecutive words.
+
+        matcher = KeywordMatcher(['fart', 'butt', 'wanna hear u echo'])
+        if matcher.matches(tweet.text):
+            ...
+    """
+
+    def __init__(self, keywords=()):
+        self.words = set()
+        self.phrases = {}
+
+        for keyword in keywords:
+            self.add(keyword)
+
+
+    def add(self, keyword):
+        tokens = tuple(keyword.lower().split())
+        if len(tokens) == 1:
+            self.words.add(tokens[0])
+        elif tokens:
+            self.phrases.setdefault(tokens[0], []).append(tokens)
+
+
+    def __len__(self):
+        return len(self.words) + sum(len(p) for p in self.phrases.values())
+
+
+    def find(self, text):
+        """
+        Returns the set of keywords that appear in the text.
+        """
+        tokens = text.lower().split()
+        found = set()
+
+        for i, token in enumerate(tokens):
+            if token in self.words:
+                found.add(token)
+            for phrase in self.phrases.get(token, ()):
+                if tuple(tokens[i:i + len(phrase)]) == phrase:
+                    found.add(' '.join(phrase))
+
+        return found
+
+
+    def matches(self, text):
+        """
+        Returns True if any keyword appears in the text.
+        """
+        tokens = text.lower().split()
+
+        for i, token in enumerate(tokens):
+            if token in self.words:
+                return True
+            for phrase in self.phrases.get(token, ()):
+                if tuple(tokens[i:i + len(phrase)]) == phrase:
+                    return True
+
+        return False
+
+
+class TimelineFilter(object):
+    """
+    Decides which home timeline tweets the bot should see: not its own, not
+    ones that mention it (those come in as mentions), and optionally none
+    that mention anybody.
+    """
+
+    def __init__(self, screen_name, ignore_mentions=True):
+        self.screen_name = screen_name.lower()
+        self.ignore_mentions = ignore_mentions
+        self.mention_pattern = re.compile('@' + re.escape(screen_name), flags=re.IGNORECASE)
+
+
+    def __call__(self, tweet):
+        if tweet.author_screen_name.lower() == self.screen_name:
+            return False
+
+        # any tweet mentioning the bot has an @ in it, so the heuristic check
+        # covers both cases
+        if self.ignore_mentions:
+            return '@' not in tweet.text
+
+        return self.mention_pattern.search(tweet.text) is None
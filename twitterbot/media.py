@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*- #
+#
+# media.py
+# --------
+
+from __future__ import unicode_literals
+
+import hashlib
+import logging
+import mimetypes
+import mmap
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+import tweepy
+
+from tweepy.binder import bind_api
+
+from twitterbot.executor import Future
+
+
+# how long Twitter keeps uploaded media around, for when it doesn't say
+DEFAULT_MEDIA_TTL = 24 * 60 * 60
+
+# don't reuse a media id that's about to expire
+EXPIRY_MARGIN = 60 * 60
+
+# the biggest file tweepy's media_upload takes; bigger ones go up in chunks
+CHUNKED_THRESHOLD = 4883 * 1024
+
+# how much of a file each APPEND sends (Twitter takes up to 5 MB)
+CHUNK_SIZE = 1024 * 1024
+
+# how long to wait between STATUS checks, for when Twitter doesn't say
+DEFAULT_CHECK_AFTER = 5
+
+# separates the parts of an APPEND's multipart body
+MULTIPART_BOUNDARY = b'Tw1tterB0t'
+
+
+class MediaCache(object):
+    """
+    Media ids of uploaded files, by content hash, along with when they
+    expire. Kept in the bot's state, so a restarted bot doesn't upload the
+    same files again.
+    """
+
+    def __init__(self, entries=None):
+        self.entries = dict(entries or {})
+        self.lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def get(self, digest, now):
+        """
+        Returns the media id for a content hash if it won't expire soon, or
+        None.
+        """
+        with self.lock:
+            entry = self.entries.get(digest)
+        if entry is not None and entry[1] - EXPIRY_MARGIN > now:
+            return entry[0]
+        return None
+
+
+    def add(self, digest, media_id, expires_at, now):
+        with self.lock:
+            self.entries[digest] = (media_id, expires_at)
+            for old in [d for d, (_, expires) in self.entries.items() if expires <= now]:
+                del self.entries[old]
+
+
+    def __getstate__(self):
+        with self.lock:
+            return {'entries': dict(self.entries)}
+
+
+    def __setstate__(self, state):
+        self.__init__(state['entries'])
+
+
+class MediaUploader(object):
+    """
+    Uploads media files, reusing the media id of anything with the same
+    contents that was uploaded before and hasn't expired.
+
+    Files are hashed and uploaded straight from memory-mapped buffers.
+    call(endpoint, *args, **kwargs) makes the actual API calls (TwitterBot
+    passes its rate-limited _call_api). Uploads of the same contents
+    happening at the same time (say, a background preload and a post)
+    share one upload.
+
+    Files up to CHUNKED_THRESHOLD go up in one media_upload call. Bigger
+    ones are uploaded in CHUNK_SIZE pieces with the INIT/APPEND/FINALIZE
+    commands (see UPLOAD_COMMANDS), each piece read as a slice of the
+    mapped file, waiting on STATUS if Twitter is still processing it.
+    """
+
+    def __init__(self, api, call, cache=None, clock=time.time, logger=None):
+        self.api = api
+        self.call = call
+        self.cache = cache if cache is not None else MediaCache()
+        self.clock = clock
+        self.logger = logger or logging.getLogger()
+
+        self.digests = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+
+
+    def digest(self, filename):
+        """
+        Returns the SHA-1 of a file's contents. Hashes are remembered by
+        path, size and modification time, so unchanged files are only read
+        once.
+        """
+        stat = os.stat(filename)
+        key = (os.path.abspath(filename), stat.st_size, stat.st_mtime)
+
+        digest = self.digests.get(key)
+        if digest is None:
+            with _mapped(filename) as buf:
+                digest = hashlib.sha1(buf).hexdigest() if buf is not None else hashlib.sha1().hexdigest()
+            self.digests[key] = digest
+
+        return digest
+
+
+    def media_id(self, filename):
+        """
+        Returns a media id for a file, uploading it if need be.
+        """
+        digest = self.digest(filename)
+
+        with self.lock:
+            media_id = self.cache.get(digest, self.clock())
+            if media_id is not None:
+                return media_id
+
+            future = self.pending.get(digest)
+            uploading = future is None
+            if uploading:
+                future = self.pending[digest] = Future()
+
+        if not uploading:
+            return future.result()
+
+        try:
+            media_id, expires_at = self._upload(filename)
+        except Exception as e:
+            with self.lock:
+                del self.pending[digest]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            self.cache.add(digest, media_id, expires_at, self.clock())
+            del self.pending[digest]
+        future.set_result(media_id)
+
+        return media_id
+
+
+    def _upload(self, filename):
+        size = os.path.getsize(filename)
+        chunked = size > CHUNKED_THRESHOLD
+
+        self.logger.info('Uploading %s (%d bytes%s)', filename, size, ', chunked' if chunked else '')
+
+        with _mapped(filename) as buf:
+            if chunked:
+                media = self._upload_chunked(filename, buf)
+            else:
+                media = self.call('media_upload', filename, file=MappedFile(buf))
+
+        ttl = getattr(media, 'expires_after_secs', None) or DEFAULT_MEDIA_TTL
+        return media.media_id, self.clock() + ttl
+
+
+    def _upload_chunked(self, filename, buf):
+        """
+        Uploads a mapped file with INIT, an APPEND for each chunk and
+        FINALIZE, then checks STATUS until Twitter has processed it.
+        Returns the Media FINALIZE (or the last STATUS) came back with.
+        """
+        media_type = mimetypes.guess_type(filename)[0]
+        if media_type is None:
+            raise tweepy.TweepError('Could not determine file type of {}'.format(filename))
+
+        media = self.call('media_upload_init', len(buf), media_type, media_category=_media_category(media_type))
+
+        for segment_index, start in enumerate(range(0, len(buf), CHUNK_SIZE)):
+            self.call('media_upload_append', media.media_id, segment_index, buf[start:start + CHUNK_SIZE])
+
+        media = self.call('media_upload_finalize', media.media_id)
+
+        while True:
+            info = getattr(media, 'processing_info', None) or {}
+            state = info.get('state')
+            if state == 'failed':
+                error = info.get('error') or {}
+                raise tweepy.TweepError('Processing {} failed: {}'.format(filename, error.get('message', state)))
+            if state not in ('pending', 'in_progress'):
+                return media
+
+            time.sleep(info.get('check_after_secs', DEFAULT_CHECK_AFTER))
+            media = self.call('media_upload_status', media.media_id)
+
+
+class MappedFile(object):
+    """
+    File-like view of an mmap, for tweepy, which reads uploads with
+    f.read() (Python 2's mmap.read() needs a size).
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+        self.pos = 0
+
+
+    def read(self, size=-1):
+        if self.buf is None:
+            return b''
+        end = len(self.buf) if size is None or size < 0 else min(self.pos + size, len(self.buf))
+        data = self.buf[self.pos:end]
+        self.pos = end
+        return data
+
+
+    def seek(self, offset, whence=0):
+        length = len(self.buf) if self.buf is not None else 0
+        if whence == 1:
+            offset += self.pos
+        elif whence == 2:
+            offset += length
+        self.pos = max(0, min(offset, length))
+
+
+    def tell(self):
+        return self.pos
+
+
+    def close(self):
+        # the mmap is closed by whoever opened it
+        pass
+
+
+def media_upload_init(api, total_bytes, media_type, media_category=None):
+    """
+    Starts a chunked upload, returning a Media with the new media_id.
+    """
+    return bind_api(
+        api=api,
+        path='/media/upload.json',
+        method='POST',
+        payload_type='media',
+        allowed_param=['total_bytes', 'media_type', 'media_category'],
+        require_auth=True,
+        upload_api=True
+    )(total_bytes, media_type, media_category, command='INIT')
+
+
+def media_upload_append(api, media_id, segment_index, chunk):
+    """
+    Sends one chunk (a byte string) of a chunked upload.
+    """
+    body = b'\r\n'.join([
+        b'--' + MULTIPART_BOUNDARY,
+        b'Content-Disposition: form-data; name="media"',
+        b'Content-Type: application/octet-stream',
+        b'',
+        chunk,
+        b'--' + MULTIPART_BOUNDARY + b'--',
+        b'',
+    ])
+    headers = {
+        'Content-Type': 'multipart/form-data; boundary=' + MULTIPART_BOUNDARY.decode('ascii'),
+        'Content-Length': str(len(body)),
+    }
+
+    return bind_api(
+        api=api,
+        path='/media/upload.json',
+        method='POST',
+        allowed_param=['media_id', 'segment_index'],
+        require_auth=True,
+        upload_api=True
+    )(media_id, segment_index, command='APPEND', headers=headers, post_data=body)
+
+
+def media_upload_finalize(api, media_id):
+    """
+    Finishes a chunked upload, returning a Media (with processing_info if
+    Twitter still has to process it).
+    """
+    return bind_api(
+        api=api,
+        path='/media/upload.json',
+        method='POST',
+        payload_type='media',
+        allowed_param=['media_id'],
+        require_auth=True,
+        upload_api=True
+    )(media_id, command='FINALIZE')
+
+
+def media_upload_status(api, media_id):
+    """
+    Returns a Media with the processing_info of a finalized upload.
+    """
+    return bind_api(
+        api=api,
+        path='/media/upload.json',
+        method='GET',
+        payload_type='media',
+        allowed_param=['media_id'],
+        require_auth=True,
+        upload_api=True,
+        use_cache=False
+    )(media_id, command='STATUS')
+
+
+# chunked upload commands tweepy has no API methods for, by endpoint name;
+# TwitterBot._call_api calls these with its api when the api lacks them
+UPLOAD_COMMANDS = {
+    'media_upload_init': media_upload_init,
+    'media_upload_append': media_upload_append,
+    'media_upload_finalize': media_upload_finalize,
+    'media_upload_status': media_upload_status,
+}
+
+
+def _media_category(media_type):
+    """
+    Returns the media_category Twitter wants for a MIME type, so videos and
+    GIFs get processed for tweets.
+    """
+    if media_type == 'image/gif':
+        return 'tweet_gif'
+    if media_type.startswith('video/'):
+        return 'tweet_video'
+    return 'tweet_image'
+
+
+@contextmanager
+def _mapped(filename):
+    """
+    with _mapped(filename) as buf: a read-only mmap of a file (or None if
+    it's empty, since empty files can't be mapped).
+    """
+    with open(filename, 'rb') as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            buf = None
+
+        try:
+            yield buf
+        finally:
+            if buf is not None:
+                buf.close()
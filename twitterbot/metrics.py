@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*- #
+#
+# metrics.py
+# ----------
+
+from __future__ import division
+from __future__ import unicode_literals
+
+import bisect
+import threading
+import time
+import BaseHTTPServer
+
+from contextlib import contextmanager
+
+
+# histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram(object):
+    """
+    Counts observations into cumulative buckets, Prometheus-style.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+    def cumulative(self):
+        """
+        Returns (upper bound, count) pairs, ending with ('+Inf', total).
+        """
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class Metrics(object):
+    """
+    Thread-safe registry of counters, gauges and histograms.
+
+    Each metric is identified by a name and a set of labels:
+
+        metrics.increment('twitterbot_tweets_posted_total', bot='fartbot')
+        with metrics.timer('twitterbot_api_seconds', endpoint='home_timeline'):
+            ...
+
+    render() returns everything in Prometheus' text format; serve() makes
+    that available over HTTP.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.types = {}
+        self.values = {}
+        self.lock = threading.Lock()
+
+
+    def _key(self, name, kind, labels):
+        self.types.setdefault(name, kind)
+        return (name, tuple(sorted(labels.items())))
+
+
+    def increment(self, name, amount=1, **labels):
+        with self.lock:
+            key = self._key(name, 'counter', labels)
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[self._key(name, 'gauge', labels)] = value
+
+
+    def observe(self, name, value, **labels):
+        with self.lock:
+            key = self._key(name, 'histogram', labels)
+            if key not in self.values:
+                self.values[key] = Histogram(self.buckets)
+            self.values[key].observe(value)
+
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Observe how many seconds the body of a with block takes, whether or
+        not it raises.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, **labels)
+
+
+    def get(self, name, **labels):
+        """
+        Returns the current value of a counter or gauge (or the Histogram),
+        or None if it hasn't been recorded.
+        """
+        with self.lock:
+            return self.values.get((name, tuple(sorted(labels.items()))))
+
+
+    def labelled(self, **labels):
+        """
+        Returns a view of the registry that adds labels to everything
+        recorded through it.
+        """
+        return LabelledMetrics(self, labels)
+
+
+    def render(self):
+        """
+        Returns every metric in Prometheus' text exposition format.
+        """
+        lines = []
+
+        with self.lock:
+            for name in sorted(self.types):
+                lines.append('# TYPE {} {}'.format(name, self.types[name]))
+
+                for (key_name, labels), value in sorted(self.values.items()):
+                    if key_name != name:
+                        continue
+
+                    if isinstance(value, Histogram):
+                        for bound, count in value.cumulative():
+                            lines.append('{}_bucket{} {}'.format(name, _labels(labels + (('le', bound),)), count))
+                        lines.append('{}_sum{} {}'.format(name, _labels(labels), value.sum))
+                        lines.append('{}_count{} {}'.format(name, _labels(labels), value.count))
+                    else:
+                        lines.append('{}{} {}'.format(name, _labels(labels), value))
+
+        return '\n'.join(lines) + '\n'
+
+
+    def serve(self, port, host='127.0.0.1'):
+        """
+        Serve render() at http://host:port/metrics from a background thread.
+        Returns the server, which can be stopped with shutdown().
+        """
+        metrics = self
+
+        class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = BaseHTTPServer.HTTPServer((host, port), Handler)
+
+        thread = threading.Thread(target=server.serve_forever, name='twitterbot-metrics')
+        thread.daemon = True
+        thread.start()
+
+        return server
+
+
+class LabelledMetrics(object):
+    """
+    A Metrics registry with some labels filled in, from Metrics.labelled().
+    """
+
+    def __init__(self, metrics, labels):
+        self.metrics = metrics
+        self.labels = labels
+
+
+    def _with(self, labels):
+        merged = dict(self.labels)
+        merged.update(labels)
+        return merged
+
+
+    def increment(self, name, amount=1, **labels):
+        self.metrics.increment(name, amount, **self._with(labels))
+
+
+    def set(self, name, value, **labels):
+        self.metrics.set(name, value, **self._with(labels))
+
+
+    def observe(self, name, value, **labels):
+        self.metrics.observe(name, value, **self._with(labels))
+
+
+    def timer(self, name, **labels):
+        return self.metrics.timer(name, **self._with(labels))
+
+
+    def get(self, name, **labels):
+        return self.metrics.get(name, **self._with(labels))
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+
+    pairs = []
+    for name, value in labels:
+        value = '{}'.format(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append('{}="{}"'.format(name, value))
+    return '{' + ','.join(pairs) + '}'
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*- #
+#
+# pacing.py
+# ---------
+
+from __future__ import unicode_literals
+
+import threading
+
+from collections import deque
+
+from twitterbot.executor import Future
+
+
+class PendingReplies(object):
+    """
+    Replies waiting to be posted, oldest first, along with the earliest
+    time the next one may go out. Kept in the bot's state, so replies that
+    were still waiting when the bot stopped are posted after a restart.
+
+    add() returns a Future for whether the reply was posted. Futures don't
+    survive a restart; replies restored from saved state are still posted.
+
+    With a maxlen, adding to a full queue drops a reply, the same way
+    TweetQueue drops tweets: the oldest one with policy='oldest', or with
+    policy='priority', the oldest of the ones whose tweet priority(tweet)
+    rates lowest (which may be the new one). A dropped reply's Future
+    comes back False, and dropped counts them. maxlen, policy and priority
+    aren't saved, so set them again after loading.
+
+    Each reply gets a sequence number when it's added, which stays the
+    same across restarts, so storage can save the replies one by one (see
+    items() and restore()).
+
+    A reply taken off with pop() is still saved with the rest until done()
+    is called for it once it's been posted, so one that was being posted
+    when the bot stopped is tried again after a restart.
+    """
+
+    def __init__(self, replies=(), next_at=0, maxlen=None, policy='oldest', priority=None, dropped=0, next_seq=0):
+        self.replies = deque()
+        self.next_at = next_at
+        self.maxlen = maxlen
+        self.policy = policy
+        self.priority = priority
+        self.dropped = dropped
+        self.next_seq = next_seq
+        self.in_flight = {}
+        self.futures = {}
+        self.lock = threading.Lock()
+
+        self.restore(replies)
+
+
+    def __len__(self):
+        return len(self.replies)
+
+
+    def add(self, text, reply_to, media=None):
+        future = Future()
+
+        with self.lock:
+            entry = (self.next_seq, text, reply_to, media)
+            self.next_seq += 1
+            self.replies.append(entry)
+            self.futures[entry[0]] = future
+
+            if self.maxlen is not None and len(self.replies) > self.maxlen:
+                dropped = self._drop()
+            else:
+                dropped = None
+
+        if dropped is not None:
+            dropped.set_result(False)
+
+        return future
+
+
+    def restore(self, replies):
+        """
+        Puts back replies saved by items(), oldest first, without dropping
+        any. Replies saved by older versions, without sequence numbers, get
+        new ones.
+        """
+        with self.lock:
+            for reply in replies:
+                if len(reply) == 3:
+                    reply = (self.next_seq,) + tuple(reply)
+                self.replies.append(tuple(reply))
+                self.next_seq = max(self.next_seq, reply[0] + 1)
+
+
+    def items(self):
+        """
+        Returns a list of (seq, text, reply_to, media) for each reply,
+        including ones that are being posted, oldest first.
+        """
+        with self.lock:
+            return self._items()
+
+
+    def _items(self):
+        return sorted(self.in_flight.values(), key=lambda reply: reply[0]) + list(self.replies)
+
+
+    def empty_copy(self):
+        """
+        Returns an empty PendingReplies with the same timing, limit and
+        counts, for storage that saves the replies themselves separately.
+        """
+        with self.lock:
+            return PendingReplies(next_at=self.next_at, maxlen=self.maxlen, policy=self.policy,
+                    priority=self.priority, dropped=self.dropped, next_seq=self.next_seq)
+
+
+    def trim(self):
+        """
+        Drops replies until the queue fits in maxlen (after maxlen has been
+        lowered). Returns how many were dropped.
+        """
+        futures = []
+
+        with self.lock:
+            while self.maxlen is not None and len(self.replies) > self.maxlen:
+                futures.append(self._drop())
+
+        for future in futures:
+            if future is not None:
+                future.set_result(False)
+
+        return len(futures)
+
+
+    def _drop(self):
+        """
+        Removes a reply to make room, returning its Future (if it has one).
+        Call with the lock held.
+        """
+        self.dropped += 1
+
+        if self.policy == 'priority' and self.priority is not None:
+            lowest = min(self.replies, key=lambda reply: self.priority(reply[2]))
+            self.replies.remove(lowest)
+        else:
+            lowest = self.replies.popleft()
+
+        return self.futures.pop(lowest[0], None)
+
+
+    def delay(self, now):
+        """
+        Returns how many seconds until the next reply is due (0 if it's due
+        now), or None if there aren't any.
+        """
+        with self.lock:
+            if not self.replies:
+                return None
+            return max(self.next_at - now, 0)
+
+
+    def pop(self, next_at):
+        """
+        Takes the oldest reply off the queue, pushing the one after it back
+        to next_at. Returns ((seq, text, reply_to, media), Future or None).
+        Call done(seq) once it's been posted.
+        """
+        with self.lock:
+            reply = self.replies.popleft()
+            self.in_flight[reply[0]] = reply
+            self.next_at = next_at
+            return reply, self.futures.pop(reply[0], None)
+
+
+    def done(self, seq):
+        """
+        Forgets a reply taken off with pop(), now that it's been posted (or
+        failed to be).
+        """
+        with self.lock:
+            self.in_flight.pop(seq, None)
+
+
+    def discard(self, seq):
+        """
+        Removes a reply, whether it's waiting or being posted, if it's still
+        here.
+        """
+        with self.lock:
+            if self.in_flight.pop(seq, None) is not None:
+                return
+            for reply in self.replies:
+                if reply[0] == seq:
+                    self.replies.remove(reply)
+                    self.futures.pop(seq, None)
+                    return
+
+
+    def __getstate__(self):
+        with self.lock:
+            return {'replies': self._items(), 'next_at': self.next_at, 'dropped': self.dropped,
+                    'next_seq': self.next_seq}
+
+
+    def __setstate__(self, state):
+        self.__init__(state['replies'], state['next_at'], dropped=state.get('dropped', 0),
+                next_seq=state.get('next_seq', 0))
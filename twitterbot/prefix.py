@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*- #
+#
+# prefix.py
+# ---------
+
+from __future__ import unicode_literals
+
+import re
+
+from collections import OrderedDict
+
+
+# an @-mention that isn't part of an email address or another mention
+MENTION_PATTERN = re.compile(r'(?<![\w@])@(\w{2,})')
+
+
+class MentionPrefixer(object):
+    """
+    Builds the string of @-mentions to start a reply with: the tweet's
+    author, then everyone else it mentions (except the bot itself), each
+    once.
+
+    Mentioned users come from the tweet's entities when it has them, which
+    include user ids; otherwise the text is scanned with a precompiled
+    pattern. Results are memoized per tweet, keyed on the follower index's
+    version, so a tweet that's handled more than once is only parsed once.
+    """
+
+    def __init__(self, screen_name, cache_size=1000):
+        self.screen_name = screen_name.lower()
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+
+    def build(self, tweet, followers=None):
+        """
+        Returns the prefix for a reply to tweet. If a FollowerIndex is given,
+        only followers (and the author) are included.
+        """
+        key = (tweet.id, None if followers is None else followers.version)
+        if key in self.cache:
+            return self.cache[key]
+
+        author = tweet.author_screen_name
+        mention_back = ['@' + author]
+        seen = set([author.lower(), self.screen_name])
+
+        if tweet.mentions:
+            mentioned = tweet.mentions
+        else:
+            mentioned = [(None, name) for name in MENTION_PATTERN.findall(tweet.text)]
+
+        for user_id, name in mentioned:
+            if name.lower() in seen:
+                continue
+            seen.add(name.lower())
+
+            if followers is not None:
+                if user_id is not None and user_id not in followers:
+                    continue
+                if user_id is None and not followers.has_screen_name(name):
+                    continue
+
+            mention_back.append('@' + name)
+
+        prefix = ' '.join(mention_back)
+
+        self.cache[key] = prefix
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        return prefix
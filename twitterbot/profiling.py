@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*- #
+#
+# profiling.py
+# ------------
+
+from __future__ import division
+from __future__ import unicode_literals
+
+import cProfile
+import logging
+import os
+import signal
+import threading
+import time
+
+
+class HandlerProfiler(object):
+    """
+    Times calls to a bot's handlers (on_mention, on_timeline and friends).
+
+    Every call's wall and CPU time goes into the twitterbot_handler_seconds
+    and twitterbot_handler_cpu_seconds histograms, and calls that take
+    longer than slow_seconds are logged along with the tweet they were
+    handling. CPU time is the whole process's, so it's only meaningful when
+    handlers aren't running side by side.
+
+    arm() (or the signal given to install_signal) profiles the next
+    dump_calls handler calls with cProfile and writes the stats to
+    <prefix>-<timestamp>.prof, for reading with pstats or snakeviz.
+    """
+
+    def __init__(self, metrics, logger=None, slow_seconds=1.0, dump_calls=50, prefix='twitterbot'):
+        self.metrics = metrics
+        self.logger = logger or logging.getLogger()
+        self.slow_seconds = slow_seconds
+        self.dump_calls = dump_calls
+        self.prefix = prefix
+
+        self.lock = threading.Lock()
+        self.profile = None
+        self.calls_left = 0
+        self.armed = False
+
+
+    def call(self, handler, tweet_id, *args):
+        """
+        Calls handler(*args), timing it. tweet_id (or None) is logged if the
+        call is slow.
+        """
+        name = handler.__name__
+        profile = self._profile_for_call()
+
+        wall_start = time.time()
+        cpu_start = _cpu_time()
+
+        try:
+            if profile is not None:
+                return profile.runcall(handler, *args)
+            return handler(*args)
+
+        finally:
+            wall = time.time() - wall_start
+            cpu = _cpu_time() - cpu_start
+
+            self.metrics.observe('twitterbot_handler_seconds', wall, handler=name)
+            self.metrics.observe('twitterbot_handler_cpu_seconds', cpu, handler=name)
+
+            if self.slow_seconds is not None and wall > self.slow_seconds:
+                self.metrics.increment('twitterbot_slow_handler_total', handler=name)
+                self.logger.warning('Slow handler: %s took %.2fs (%.2fs CPU)%s',
+                    name, wall, cpu, '' if tweet_id is None else ' on tweet {}'.format(tweet_id))
+
+            if profile is not None:
+                self._finish_call()
+
+
+    def arm(self, calls=None):
+        """
+        Profile the next `calls` handler calls (dump_calls by default).
+        """
+        # may be called from a signal handler, so no locking here
+        self.calls_left = calls or self.dump_calls
+        self.armed = True
+
+
+    def install_signal(self, signum=getattr(signal, 'SIGUSR2', None)):
+        """
+        Call arm() whenever the process receives signum, keeping any handler
+        that was already installed (so several hosted bots can share it).
+        Only works from the main thread; returns False if it couldn't.
+        """
+        if signum is None:
+            return False
+
+        previous = signal.getsignal(signum)
+
+        def on_signal(received, frame):
+            self.arm()
+            if callable(previous):
+                previous(received, frame)
+
+        try:
+            signal.signal(signum, on_signal)
+        except ValueError:
+            # not the main thread
+            return False
+
+        return True
+
+
+    def _profile_for_call(self):
+        with self.lock:
+            if self.armed:
+                self.armed = False
+                self.profile = cProfile.Profile()
+                self.logger.info('Profiling the next %d handler calls', self.calls_left)
+
+            if self.profile is not None and self.calls_left > 0:
+                return self.profile
+
+
+    def _finish_call(self):
+        with self.lock:
+            self.calls_left -= 1
+            if self.calls_left > 0 or self.profile is None:
+                return
+
+            profile, self.profile = self.profile, None
+
+        filename = '{}-{}.prof'.format(self.prefix, time.strftime('%Y%m%d-%H%M%S'))
+        profile.dump_stats(filename)
+        self.logger.info('Handler profile written to %s', os.path.abspath(filename))
+
+
+def _cpu_time():
+    user, system = os.times()[:2]
+    return user + system
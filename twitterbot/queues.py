@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*- #
+#
+# queues.py
+# ---------
+
+from __future__ import unicode_literals
+
+import heapq
+
+from collections import deque
+
+
+class TweetQueue(object):
+    """
+    FIFO queue of tweets waiting to be handled.
+
+    Tweets are appended oldest-first and taken from the front in O(1). The
+    intended pattern is peek(), handle the tweet, then pop() it, so a tweet
+    only leaves the queue once it has actually been dealt with.
+
+    With a maxlen, appending to a full queue drops a tweet: the oldest one
+    with policy='oldest', or with policy='priority', the oldest of the ones
+    that priority(tweet) rates lowest (which may be the new tweet, if it
+    rates lower than all the others). trim() drops the same way. dropped
+    counts how many have been dropped. priority isn't saved with the queue,
+    so set it again after loading one.
+
+    Tweets are kept in one deque per priority level (just one, unless the
+    policy is 'priority'), so dropping is O(1) in the length of the queue.
+    """
+
+    def __init__(self, tweets=None, maxlen=None, policy='oldest', priority=None):
+        self.levels = {}
+        self.length = 0
+        self.next_seq = 0
+        self.maxlen = maxlen
+        self._policy = policy
+        self._priority = priority
+        self.dropped = 0
+
+        self.extend(tweets or [])
+
+
+    def __getstate__(self):
+        return {'tweets': list(self), 'maxlen': self.maxlen, 'policy': self._policy, 'dropped': self.dropped}
+
+
+    def __setstate__(self, state):
+        # queues saved by older versions had no limit
+        self.__init__(maxlen=state.get('maxlen'), policy=state.get('policy', 'oldest'))
+        self.dropped = state.get('dropped', 0)
+        for tweet in state['tweets']:
+            self._push(tweet)
+
+
+    @property
+    def policy(self):
+        return self._policy
+
+
+    @policy.setter
+    def policy(self, policy):
+        self._policy = policy
+        self._relevel()
+
+
+    @property
+    def priority(self):
+        return self._priority
+
+
+    @priority.setter
+    def priority(self, priority):
+        self._priority = priority
+        self._relevel()
+
+
+    def empty_copy(self):
+        """
+        Returns an empty queue with the same limit, policy and drop count.
+        """
+        queue = TweetQueue(maxlen=self.maxlen, policy=self._policy, priority=self._priority)
+        queue.dropped = self.dropped
+        return queue
+
+
+    def __len__(self):
+        return self.length
+
+
+    def __iter__(self):
+        for seq, tweet in heapq.merge(*self.levels.values()):
+            yield tweet
+
+
+    def append(self, tweet):
+        """
+        Adds a tweet to the back of the queue. Returns the tweet that was
+        dropped to make room for it, if any.
+        """
+        if self.maxlen is None or self.length < self.maxlen:
+            self._push(tweet)
+            return None
+
+        self.dropped += 1
+
+        if not self.levels or self._level(tweet) < min(self.levels):
+            return tweet
+
+        self._push(tweet)
+        return self._drop()
+
+
+    def extend(self, tweets):
+        for tweet in tweets:
+            self.append(tweet)
+
+
+    def trim(self):
+        """
+        Drops tweets until the queue fits in maxlen (after maxlen has been
+        lowered). Returns how many were dropped.
+        """
+        excess = 0 if self.maxlen is None else max(self.length - self.maxlen, 0)
+        for _ in range(excess):
+            self._drop()
+        self.dropped += excess
+        return excess
+
+
+    def peek(self):
+        """
+        Returns the tweet at the front of the queue without removing it, or
+        None if the queue is empty.
+        """
+        if not self.levels:
+            return None
+        return min(level[0] for level in self.levels.values())[1]
+
+
+    def pop(self):
+        """
+        Removes and returns the tweet at the front of the queue.
+        """
+        if not self.levels:
+            raise IndexError('pop from an empty queue')
+        return self._pop_level(min(self.levels, key=lambda level: self.levels[level][0][0]))
+
+
+    def _level(self, tweet):
+        if self._policy == 'priority' and self._priority is not None:
+            return self._priority(tweet)
+        return 0
+
+
+    def _push(self, tweet):
+        level = self._level(tweet)
+        if level not in self.levels:
+            self.levels[level] = deque()
+        self.levels[level].append((self.next_seq, tweet))
+        self.next_seq += 1
+        self.length += 1
+
+
+    def _pop_level(self, level):
+        tweets = self.levels[level]
+        seq, tweet = tweets.popleft()
+        if not tweets:
+            del self.levels[level]
+        self.length -= 1
+        return tweet
+
+
+    def _drop(self):
+        """
+        Removes and returns the oldest of the lowest priority tweets.
+        """
+        return self._pop_level(min(self.levels))
+
+
+    def _relevel(self):
+        """
+        Sorts the tweets into levels again, after the policy or priority
+        function has changed.
+        """
+        tweets = list(self)
+        self.levels = {}
+        self.length = 0
+        for tweet in tweets:
+            self._push(tweet)
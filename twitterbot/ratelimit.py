@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*- #
+#
+# ratelimit.py
+# ------------
+
+from __future__ import division
+from __future__ import unicode_literals
+
+import logging
+import threading
+import time
+
+import tweepy
+
+
+# API method name -> resource path, as it appears in request URLs
+ENDPOINTS = {
+    'mentions_timeline': '/statuses/mentions_timeline',
+    'home_timeline': '/statuses/home_timeline',
+    'followers_ids': '/followers/ids',
+    'friends_ids': '/friends/ids',
+    'update_status': '/statuses/update',
+    'create_favorite': '/favorites/create',
+    'create_friendship': '/friendships/create',
+    'lookup_users': '/users/lookup',
+    'media_upload': '/media/upload',
+    'media_upload_init': '/media/upload',
+    'media_upload_append': '/media/upload',
+    'media_upload_finalize': '/media/upload',
+    'media_upload_status': '/media/upload',
+}
+
+# how long Twitter's rate limit windows last, for when it doesn't say
+DEFAULT_WINDOW = 15 * 60
+
+
+class RateLimited(tweepy.TweepError):
+    """
+    Raised instead of calling an endpoint that's out of calls, `wait`
+    seconds before its window resets.
+    """
+
+    def __init__(self, endpoint, wait):
+        tweepy.TweepError.__init__(self, 'Rate limited on {} for another {:.0f} seconds'.format(endpoint, wait))
+        self.endpoint = endpoint
+        self.wait = wait
+
+
+class TokenBucket(object):
+    """
+    Allows up to `capacity` calls at once, refilling at `rate` calls per
+    second.
+    """
+
+    def __init__(self, rate, capacity, clock=time.time):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.clock = clock
+        self.updated = clock()
+
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+    def take(self):
+        """
+        Take a token if there is one. Returns 0 if it did, or how many
+        seconds until there will be one if not.
+        """
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class RateGovernor(object):
+    """
+    Keeps track of Twitter's rate limits for each API endpoint.
+
+    Remaining calls and reset times are read from the x-rate-limit-* headers
+    of each response, so the bot can hold off on an endpoint until its
+    window resets instead of burning requests on errors. Outbound calls
+    (posting, faving, following) are also paced by token buckets, given as
+    {endpoint: (calls, per_seconds)}.
+    """
+
+    def __init__(self, pacing=None, clock=time.time, sleep=time.sleep, logger=None):
+        self.logger = logger or logging.getLogger()
+        self.clock = clock
+        self.sleep = sleep
+        self.limits = {}
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+        for endpoint, (calls, per) in (pacing or {}).items():
+            self.buckets[endpoint] = TokenBucket(calls / per, calls, clock=clock)
+
+
+    def update(self, endpoint, response):
+        """
+        Record the rate limit headers from an API response, if it came from
+        the given endpoint.
+        """
+        if response is None or ENDPOINTS.get(endpoint, '') not in getattr(response, 'url', ''):
+            return
+
+        headers = getattr(response, 'headers', None) or {}
+        try:
+            remaining = int(headers['x-rate-limit-remaining'])
+            reset = int(headers['x-rate-limit-reset'])
+        except (KeyError, ValueError, TypeError):
+            return
+
+        with self.lock:
+            self.limits[endpoint] = (remaining, reset)
+
+
+    def exhaust(self, endpoint, reset=None):
+        """
+        Mark an endpoint as out of calls until `reset` (a timestamp), or for
+        one rate limit window if Twitter didn't say.
+        """
+        if reset is None:
+            reset = self.clock() + DEFAULT_WINDOW
+
+        with self.lock:
+            self.limits[endpoint] = (0, reset)
+
+        self.logger.warning('Rate limited on %s for %.0f seconds', endpoint, reset - self.clock())
+
+
+    def delay(self, endpoint):
+        """
+        Returns how many seconds to wait before calling an endpoint.
+        """
+        with self.lock:
+            remaining, reset = self.limits.get(endpoint, (1, 0))
+
+        if remaining > 0:
+            return 0
+        return max(reset - self.clock(), 0)
+
+
+    def acquire(self, endpoint):
+        """
+        Take a token from an endpoint's bucket if it has one, waiting for it
+        if need be. Raises RateLimited if the endpoint is out of calls until
+        its window resets, rather than holding up the bot for that long.
+        """
+        wait = self.delay(endpoint)
+        if wait > 0:
+            raise RateLimited(endpoint, wait)
+
+        bucket = self.buckets.get(endpoint)
+        if bucket is None:
+            return
+
+        while True:
+            with self.lock:
+                wait = bucket.take()
+            if wait == 0:
+                return
+            self.sleep(wait)
+
+
+def is_rate_limit_error(e):
+    """
+    Returns True if a TweepError means we hit a rate limit.
+    """
+    if isinstance(e, RateLimited):
+        return True
+
+    response = getattr(e, 'response', None)
+    if response is not None and getattr(response, 'status_code', None) == 429:
+        return True
+
+    # 88 is "rate limit exceeded", 185 is "over daily status update limit"
+    return getattr(e, 'api_code', None) in (88, 185)
+
+
+def reset_time(e):
+    """
+    Returns the reset timestamp from a rate limit error's response, if any.
+    """
+    response = getattr(e, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        return int(headers['x-rate-limit-reset'])
+    except (KeyError, ValueError, TypeError):
+        return None
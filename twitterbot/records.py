@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*- #
+#
+# records.py
+# ----------
+
+from __future__ import unicode_literals
+
+
+class UserRecord(object):
+    """
+    The bits of a Twitter user the bot cares about.
+    """
+
+    __slots__ = ('id', 'screen_name')
+
+    def __init__(self, id, screen_name):
+        self.id = id
+        self.screen_name = screen_name
+
+
+    def __getstate__(self):
+        return (self.id, self.screen_name)
+
+
+    def __setstate__(self, state):
+        self.id, self.screen_name = state
+
+
+    def __repr__(self):
+        return 'UserRecord(id={!r}, screen_name={!r})'.format(self.id, self.screen_name)
+
+
+class TweetRecord(object):
+    """
+    Compact stand-in for a tweepy.Status.
+
+    Only keeps what the bot and its handlers use: the id and text, who wrote
+    it, what it replies to, and who it mentions (as (id, screen_name) pairs).
+    tweet.author and tweet.user work like they do on a Status. The raw JSON
+    payload is only kept if asked for, and is available as tweet.raw.
+    """
+
+    __slots__ = ('id', 'text', 'author_id', 'author_screen_name',
+            'in_reply_to_status_id', 'in_reply_to_user_id', 'in_reply_to_screen_name',
+            'mentions', 'raw')
+
+    def __init__(self, id, text, author_id, author_screen_name,
+            in_reply_to_status_id=None, in_reply_to_user_id=None, in_reply_to_screen_name=None,
+            mentions=(), raw=None):
+        self.id = id
+        self.text = text
+        self.author_id = author_id
+        self.author_screen_name = author_screen_name
+        self.in_reply_to_status_id = in_reply_to_status_id
+        self.in_reply_to_user_id = in_reply_to_user_id
+        self.in_reply_to_screen_name = in_reply_to_screen_name
+        self.mentions = tuple(mentions)
+        self.raw = raw
+
+
+    @classmethod
+    def from_status(cls, status, keep_raw=False):
+        """
+        Build a record from a tweepy.Status. Records are passed through as-is.
+        """
+        if isinstance(status, cls):
+            return status
+
+        entities = getattr(status, 'entities', None) or {}
+        mentions = [(m['id'], m['screen_name']) for m in entities.get('user_mentions', [])]
+
+        return cls(status.id,
+                getattr(status, 'full_text', None) or status.text,
+                status.author.id,
+                status.author.screen_name,
+                in_reply_to_status_id=getattr(status, 'in_reply_to_status_id', None),
+                in_reply_to_user_id=getattr(status, 'in_reply_to_user_id', None),
+                in_reply_to_screen_name=getattr(status, 'in_reply_to_screen_name', None),
+                mentions=mentions,
+                raw=getattr(status, '_json', None) if keep_raw else None)
+
+
+    @property
+    def author(self):
+        return UserRecord(self.author_id, self.author_screen_name)
+
+
+    @property
+    def user(self):
+        return self.author
+
+
+    def __getstate__(self):
+        return tuple(getattr(self, slot) for slot in self.__slots__)
+
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            setattr(self, slot, value)
+
+
+    def __repr__(self):
+        return 'TweetRecord(id={!r}, author_screen_name={!r}, text={!r})'.format(
+                self.id, self.author_screen_name, self.text)
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*- #
+#
+# scheduler.py
+# ------------
+
+from __future__ import division
+from __future__ import unicode_literals
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+
+class Job(object):
+    """
+    A recurring action registered with a Scheduler.
+    """
+
+    def __init__(self, action, interval, next_run, name=None):
+        self.action = action
+        self.interval = interval
+        self.next_run = next_run
+        self.name = name or getattr(action, '__name__', 'job')
+        self.cancelled = False
+
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Scheduler(object):
+    """
+    Runs recurring jobs in deadline order.
+
+    Jobs are kept in a heap keyed on their next run time, and run() sleeps
+    exactly until the earliest one is due, so intervals can be as short (or
+    as long) as you like. If a job's action returns a number, that's used as
+    the delay until it runs again instead of its interval.
+
+    If on_error is given, a job that raises calls on_error(job, exception)
+    and is rescheduled as usual instead of stopping the scheduler.
+
+    Jobs can be added from other threads; run() wakes up for them if they're
+    due sooner than what it was waiting for (unless a sleep function is
+    given to wait with instead).
+    """
+
+    def __init__(self, clock=time.time, sleep=None, on_error=None):
+        self.on_error = on_error
+        self.clock = clock
+        self.sleep = sleep
+        self.heap = []
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.counter = itertools.count()
+        self.running = False
+
+
+    def __len__(self):
+        return len(self.heap)
+
+
+    def add(self, action, interval, first_run=None, name=None):
+        """
+        Schedule action() to run every interval seconds, starting at
+        first_run (a timestamp; defaults to one interval from now). Returns
+        the Job, which can be cancelled.
+        """
+        if first_run is None:
+            first_run = self.clock() + interval
+
+        job = Job(action, interval, first_run, name=name)
+        self._push(job)
+        return job
+
+
+    def add_once(self, action, first_run=None, name=None):
+        """
+        Schedule action() to run once, at first_run (a timestamp; defaults to
+        right away). Returns the Job.
+        """
+        def once():
+            job.cancel()
+            action()
+
+        job = self.add(once, 0, first_run=self.clock() if first_run is None else first_run,
+                name=name or getattr(action, '__name__', None))
+        return job
+
+
+    def _push(self, job):
+        with self.lock:
+            heapq.heappush(self.heap, (job.next_run, next(self.counter), job))
+        self.wakeup.set()
+
+
+    def next_run(self):
+        """
+        Returns the time the next job is due, or None if nothing is scheduled.
+        """
+        with self.lock:
+            while self.heap and self.heap[0][2].cancelled:
+                heapq.heappop(self.heap)
+            return self.heap[0][0] if self.heap else None
+
+
+    def run_pending(self):
+        """
+        Run every job that is due. Returns the number of jobs run.
+        """
+        ran = 0
+        now = self.clock()
+
+        while True:
+            with self.lock:
+                if not self.heap or self.heap[0][0] > now:
+                    break
+                job = heapq.heappop(self.heap)[2]
+
+            if job.cancelled:
+                continue
+
+            try:
+                delay = job.action()
+            except Exception as e:
+                if self.on_error is None:
+                    raise
+                self.on_error(job, e)
+                delay = None
+
+            ran += 1
+
+            if job.cancelled:
+                continue
+
+            job.next_run = self.clock() + (job.interval if delay is None else delay)
+            self._push(job)
+
+        return ran
+
+
+    def run(self):
+        """
+        Run jobs as they come due until stop() is called or nothing is left
+        to run.
+        """
+        self.running = True
+
+        while self.running:
+            self.wakeup.clear()
+            next_run = self.next_run()
+            if next_run is None:
+                break
+
+            delay = next_run - self.clock()
+            if delay > 0:
+                logging.debug('Next job in %.2f seconds', delay)
+                if self.sleep is not None:
+                    self.sleep(delay)
+                else:
+                    self.wakeup.wait(delay)
+
+            self.run_pending()
+
+        self.running = False
+
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
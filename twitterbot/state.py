@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*- #
+#
+# state.py
+# --------
+
+from __future__ import unicode_literals
+
+import logging
+import sys
+import threading
+import cPickle as pickle
+
+from collections import deque
+from contextlib import contextmanager
+
+from twitterbot.dedup import SeenTweets
+from twitterbot.followers import FollowerIndex
+from twitterbot.pacing import PendingReplies
+from twitterbot.queues import TweetQueue
+
+
+class BotState(dict):
+    """
+    The bot's state dictionary.
+
+    Behaves like a normal dict, but remembers which keys have been assigned
+    or deleted since the last time changes were collected. Values that are
+    changed in place (e.g. appending to a list) can't be seen, so call
+    touch(key) after mutating them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self, *args, **kwargs)
+        self.dirty = set()
+        self.deleted = set()
+
+        # actions running on worker threads can touch keys while the main
+        # thread is collecting changes
+        self.changes_lock = threading.Lock()
+
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self.touch(key)
+
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        with self.changes_lock:
+            self.dirty.discard(key)
+            self.deleted.add(key)
+
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+
+    def pop(self, key, *default):
+        if key in self:
+            value = self[key]
+            del self[key]
+            return value
+        return dict.pop(self, key, *default)
+
+
+    def touch(self, key):
+        """
+        Mark a key as changed.
+        """
+        with self.changes_lock:
+            self.dirty.add(key)
+            self.deleted.discard(key)
+
+
+    def collect_changes(self):
+        """
+        Returns a (changed, deleted) tuple describing everything that happened
+        since the last call, and starts tracking afresh.
+        """
+        with self.changes_lock:
+            dirty, self.dirty = self.dirty, set()
+            deleted, self.deleted = self.deleted, set()
+
+        changed = dict((key, self[key]) for key in dirty if key in self)
+        return changed, list(deleted)
+
+
+class StateJournal(object):
+    """
+    Incremental persistence for BotState.
+
+    The full state is kept as a snapshot under the bot's name (in the same
+    format a plain save would write) and every save after that only appends
+    the keys that changed to a journal. Once the journal has compact_every
+    entries it is folded back into a new snapshot.
+
+    Containers that change a little at a time (TweetQueue, SeenTweets,
+    PendingReplies and FollowerIndex) aren't journaled whole: their entries only hold
+    what was added and the ids of what was removed since the last save.
+
+    The storage adapter must implement append(name) in addition to read(name)
+    and write(name).
+    """
+
+    def __init__(self, storage, name, compact_every=100, logger=None):
+        self.logger = logger or logging.getLogger()
+        self.storage = storage
+        self.name = name
+        self.journal_name = name + '_journal'
+        self.compact_every = compact_every
+        self.entries = 0
+
+        # ids of what each container held when it was last written
+        self.saved = {}
+
+
+    def load(self):
+        """
+        Returns the state rebuilt from the snapshot plus the journal. Raises
+        IOError if nothing has been saved yet.
+        """
+        with self.storage.read(self.name) as f:
+            state = pickle.load(f)
+
+        generation = state.get('journal_generation', 0)
+
+        try:
+            with self.storage.read(self.journal_name) as f:
+                while True:
+                    try:
+                        entry = pickle.load(f)
+                    except EOFError:
+                        break
+                    except Exception:
+                        # a partially written entry from a crash; everything
+                        # before it is still good
+                        self.logger.warning('Ignoring truncated entry at the end of the state journal')
+                        break
+
+                    # entries written by older versions had no deltas
+                    entry_generation, changed, deleted = entry[:3]
+                    deltas = entry[3] if len(entry) > 3 else {}
+
+                    # entries older than the snapshot were already folded in
+                    if entry_generation < generation:
+                        continue
+
+                    self.entries += 1
+                    state.update(changed)
+                    for key, (empty, added, removed) in deltas.items():
+                        if key in state:
+                            state[key] = _apply_delta(state[key], empty, added, removed)
+                    for key in deleted:
+                        state.pop(key, None)
+
+        except IOError:
+            pass
+
+        self._remember(state)
+        return BotState(state)
+
+
+    def record(self, state):
+        """
+        Append whatever changed in the state since the last call.
+        """
+        changed, deleted = state.collect_changes()
+        if not changed and not deleted:
+            return
+
+        if self.entries >= self.compact_every:
+            self.compact(state)
+            return
+
+        deltas = {}
+        saved = {}
+
+        for key, value in list(changed.items()):
+            items = _items(value)
+            if items is None:
+                continue
+
+            ids = set(item_id for item_id, item in items)
+            if key in self.saved:
+                previous = self.saved[key]
+                added = [item for item_id, item in items if item_id not in previous]
+                deltas[key] = (_empty_copy(value), added, previous - ids)
+                del changed[key]
+            saved[key] = ids
+
+        with self.storage.append(self.journal_name) as f:
+            pickle.dump((state.get('journal_generation', 0), changed, deleted, deltas), f, pickle.HIGHEST_PROTOCOL)
+
+        self.saved.update(saved)
+        for key in deleted:
+            self.saved.pop(key, None)
+        self.entries += 1
+
+
+    def compact(self, state):
+        """
+        Write a full snapshot of the state and empty the journal.
+        """
+        state['journal_generation'] = state.get('journal_generation', 0) + 1
+
+        # other threads can change the state while it's written: collect
+        # first so their changes make the next entry, and remember what's
+        # in the snapshot before writing it, so the next deltas cover
+        # anything added in between (load() skips what's already there)
+        state.collect_changes()
+        snapshot = dict(state)
+        self._remember(snapshot)
+
+        with self.storage.write(self.name) as f:
+            pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+
+        with self.storage.write(self.journal_name):
+            pass
+
+        self.entries = 0
+
+
+    def _remember(self, state):
+        self.saved = {}
+        for key, value in state.items():
+            items = _items(value)
+            if items is not None:
+                self.saved[key] = set(item_id for item_id, item in items)
+
+
+def _items(value):
+    """
+    Returns [(id, item)], oldest first, for the containers StateJournal
+    records changes to instead of whole values, or None for anything else.
+    """
+    if isinstance(value, TweetQueue):
+        return [(tweet.id, tweet) for tweet in value]
+    if isinstance(value, SeenTweets):
+        return [(tweet_id, tweet_id) for tweet_id in value.__getstate__()['ids']]
+    if isinstance(value, PendingReplies):
+        return [(reply[0], reply) for reply in value.items()]
+    if isinstance(value, FollowerIndex):
+        # keyed on the screen name too, so learning one counts as a change
+        screen_names = dict(value.screen_names)
+        members = [(user_id, screen_names.get(user_id)) for user_id in list(value.ids)]
+        return [(member, member) for member in members]
+    return None
+
+
+def _items_of(empty, added):
+    """
+    Returns [(id, item)] for items journaled as added to a container like
+    empty.
+    """
+    if isinstance(empty, TweetQueue):
+        return [(tweet.id, tweet) for tweet in added]
+    if isinstance(empty, PendingReplies):
+        return [(reply[0], reply) for reply in added]
+    return [(item, item) for item in added]
+
+
+def _empty_copy(value):
+    if isinstance(value, SeenTweets):
+        return SeenTweets(value.capacity)
+    if isinstance(value, FollowerIndex):
+        return FollowerIndex()
+    return value.empty_copy()
+
+
+def _apply_delta(value, empty, added, removed):
+    """
+    Fills empty (a container as returned by _empty_copy) with what value
+    held, less the removed ids, plus the added items it didn't have yet.
+    """
+    kept = [(item_id, item) for item_id, item in _items(value) if item_id not in removed]
+    ids = set(item_id for item_id, item in kept)
+    items = [item for item_id, item in kept]
+    items.extend(item for item_id, item in _items_of(empty, added) if item_id not in ids)
+
+    if isinstance(empty, TweetQueue):
+        empty.extend(items)
+    elif isinstance(empty, SeenTweets):
+        for tweet_id in items:
+            empty.add(tweet_id)
+    elif isinstance(empty, FollowerIndex):
+        for user_id, screen_name in items:
+            empty.ids.add(user_id)
+            if screen_name is not None:
+                empty.remember(user_id, screen_name)
+    else:
+        empty.restore(items)
+
+    return empty
+
+
+class ProgressLog(object):
+    """
+    Append-only record of the work the bot has done since its state was
+    last saved in full: tweets it has handled and replies it has queued or
+    sent. Each entry is on disk as soon as record() returns, so a crash
+    partway through a batch neither loses work nor repeats it; load()
+    returns the entries to replay over the saved state at startup.
+
+    Save the state inside `with progress.saving():`, which empties the log
+    once the save has gone through.
+
+    The storage adapter must implement append(name), and what it appends
+    must be on disk once the object append returned is closed.
+    """
+
+    def __init__(self, storage, name, logger=None):
+        self.logger = logger or logging.getLogger()
+        self.storage = storage
+        self.name = name + '_progress'
+        self.entries = 0
+        self.lock = threading.Lock()
+
+
+    def record(self, *entry):
+        with self.lock:
+            with self.storage.append(self.name) as f:
+                pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+            self.entries += 1
+
+
+    def load(self):
+        """
+        Returns the entries recorded since the last full save, oldest first.
+        """
+        entries = []
+
+        try:
+            with self.storage.read(self.name) as f:
+                while True:
+                    try:
+                        entries.append(pickle.load(f))
+                    except EOFError:
+                        break
+                    except Exception:
+                        # a partially written entry from a crash
+                        self.logger.warning('Ignoring truncated entry at the end of the progress log')
+                        break
+        except IOError:
+            pass
+
+        self.entries = len(entries)
+        return entries
+
+
+    @contextmanager
+    def saving(self):
+        """
+        Holds off new entries while the state is saved, then empties the
+        log (unless the save raised).
+        """
+        with self.lock:
+            yield
+
+            if self.entries:
+                with self.storage.write(self.name):
+                    pass
+                self.entries = 0
+
+
+def sizeof(value):
+    """
+    Estimates how many bytes of memory a value takes up, including
+    everything it holds: container contents and object attributes. Objects
+    shared between parts of the value are only counted once; functions and
+    methods aren't followed.
+    """
+    seen = set()
+    total = 0
+    stack = [value]
+
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or callable(obj):
+            continue
+        seen.add(id(obj))
+
+        total += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+            stack.extend(obj)
+        else:
+            if hasattr(obj, '__dict__'):
+                stack.append(obj.__dict__)
+            for slot in getattr(type(obj), '__slots__', ()):
+                if hasattr(obj, slot):
+                    stack.append(getattr(obj, slot))
+
+    return total
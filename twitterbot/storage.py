@@ -0,0 +1,469 @@
+# -*- coding: utf-8 -*- #
+#
+# storage.py
+# ----------
+
+from __future__ import unicode_literals
+
+import io
+import logging
+import os
+import sqlite3
+import tempfile
+import threading
+import cPickle as pickle
+
+from twitterbot.dedup import SeenTweets
+from twitterbot.followers import FollowerIndex
+from twitterbot.pacing import PendingReplies
+from twitterbot.queues import TweetQueue
+
+# storage is used before the bot has set up logging, so it logs through a
+# named logger instead of the root one
+storage_log = logging.getLogger('twitterbot.storage')
+
+
+class FileStorage(object):
+    """
+    Default storage adapter.
+
+    Adapters must implement two methods: read(name) and write(name).
+    Adapters that also implement append(name) can be used with
+    config['state_journal'], and let the bot record its progress between
+    saves (see ProgressLog), so a crash doesn't lose or repeat work. Adapters that implement load_state(name) and
+    save_state(name, state) (like SqliteStorage) store the bot's state
+    themselves instead of having it pickled into write(name).
+    """
+
+
+    def read(self, name):
+        """
+        Return an IO-like object that will produce binary data when read from.
+        If nothing is stored under the given name, raise IOError.
+        """
+        filename = self._get_filename(name)
+        if os.path.exists(filename):
+            storage_log.debug("Reading from %s", filename)
+        else:
+            storage_log.debug("%s doesn't exist", filename)
+        return open(filename)
+
+
+    def write(self, name):
+        """
+        Return an IO-like object that will store binary data written to it.
+        The data replaces what was stored before once the object is closed,
+        so a crash partway through a write leaves the old data intact.
+        """
+        filename = self._get_filename(name)
+        if os.path.exists(filename):
+            storage_log.debug("Overwriting %s", filename)
+        else:
+            storage_log.debug("Creating %s", filename)
+        return _AtomicFile(filename)
+
+
+    def append(self, name):
+        """
+        Return an IO-like object that will add binary data to the end of
+        whatever is stored under the given name. The data is on disk once
+        the object is closed.
+        """
+        filename = self._get_filename(name)
+        storage_log.debug("Appending to %s", filename)
+        return _AppendFile(filename)
+
+
+    def _get_filename(self, name):
+        return '{}_state.pkl'.format(name)
+
+
+class _AtomicFile(object):
+    """
+    Writes to a temporary file next to filename, and renames it over
+    filename when closed. Leaving a with block with an exception throws
+    the new data away instead.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        fd, self.tmp_path = tempfile.mkstemp(prefix=os.path.basename(filename) + '.',
+                suffix='.tmp', dir=os.path.dirname(os.path.abspath(filename)))
+        self.f = os.fdopen(fd, 'wb')
+
+
+    def write(self, data):
+        self.f.write(data)
+
+
+    def close(self):
+        if self.f.closed:
+            return
+
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+
+        try:
+            os.rename(self.tmp_path, self.filename)
+        except OSError:
+            # Windows won't rename over an existing file
+            os.remove(self.filename)
+            os.rename(self.tmp_path, self.filename)
+
+
+    def discard(self):
+        self.f.close()
+        os.remove(self.tmp_path)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+
+class _AppendFile(object):
+    """
+    Appends to filename, flushing what was written to disk when closed.
+    """
+
+    def __init__(self, filename):
+        self.f = open(filename, 'ab')
+
+
+    def write(self, data):
+        self.f.write(data)
+
+
+    def close(self):
+        if self.f.closed:
+            return
+
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SqliteStorage(object):
+    """
+    Storage adapter that keeps the state of one or more bots in a SQLite
+    database.
+
+    Instead of pickling the whole state on every save, each save is one
+    transaction that only writes what changed:
+
+    - followers and friends go in the users table, one row per user (with
+      their screen name, if known)
+    - mention_queue goes in the queue table, one row per tweet
+    - seen_tweets goes in the seen table, one row per tweet id
+    - pending_replies goes in the replies table, one row per reply
+    - everything else goes in the state table, one pickled value per key
+
+    For the tables, only rows that were added or removed since the last save
+    are written. To know which, the adapter keeps a copy of the ids it last
+    saved for each.
+
+    read(name), write(name) and append(name) work too, on named blobs, for
+    things like the cached account identity.
+    """
+
+    def __init__(self, path='twitterbot.db'):
+        self.path = path
+        self.lock = threading.RLock()
+        self.saved = {}
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # WAL keeps the database consistent if we crash mid-save
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+
+        with self.db:
+            self.db.executescript("""
+                CREATE TABLE IF NOT EXISTS state (
+                    bot TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL,
+                    PRIMARY KEY (bot, key));
+                CREATE TABLE IF NOT EXISTS users (
+                    bot TEXT NOT NULL, kind TEXT NOT NULL, user_id INTEGER NOT NULL, screen_name TEXT,
+                    PRIMARY KEY (bot, kind, user_id));
+                CREATE INDEX IF NOT EXISTS users_screen_name ON users (bot, kind, screen_name);
+                CREATE TABLE IF NOT EXISTS queue (
+                    bot TEXT NOT NULL, key TEXT NOT NULL, tweet_id INTEGER NOT NULL, tweet BLOB NOT NULL,
+                    PRIMARY KEY (bot, key, tweet_id));
+                CREATE TABLE IF NOT EXISTS seen (
+                    bot TEXT NOT NULL, key TEXT NOT NULL, tweet_id INTEGER NOT NULL, seq INTEGER NOT NULL,
+                    PRIMARY KEY (bot, key, tweet_id));
+                CREATE INDEX IF NOT EXISTS seen_seq ON seen (bot, key, seq);
+                CREATE TABLE IF NOT EXISTS replies (
+                    bot TEXT NOT NULL, key TEXT NOT NULL, seq INTEGER NOT NULL, reply BLOB NOT NULL,
+                    PRIMARY KEY (bot, key, seq));
+                CREATE TABLE IF NOT EXISTS blobs (
+                    name TEXT NOT NULL, seq INTEGER PRIMARY KEY AUTOINCREMENT, data BLOB NOT NULL);
+                CREATE INDEX IF NOT EXISTS blobs_name ON blobs (name, seq);
+            """)
+
+
+    def read(self, name):
+        """
+        Return an IO-like object that will produce the binary data stored
+        under name. If there isn't any, raise IOError.
+        """
+        with self.lock:
+            rows = self.db.execute('SELECT data FROM blobs WHERE name = ? ORDER BY seq', (name,)).fetchall()
+
+        if not rows:
+            storage_log.debug("%s doesn't exist in %s", name, self.path)
+            raise IOError('Nothing stored under {}'.format(name))
+
+        storage_log.debug('Reading %s from %s', name, self.path)
+        return io.BytesIO(b''.join(bytes(row[0]) for row in rows))
+
+
+    def write(self, name):
+        """
+        Return an IO-like object that will replace whatever is stored under
+        name with the data written to it once it's closed.
+        """
+        storage_log.debug('Writing %s to %s', name, self.path)
+        return _BlobWriter(self, name, replace=True)
+
+
+    def append(self, name):
+        """
+        Return an IO-like object that will add the data written to it to the
+        end of whatever is stored under name once it's closed.
+        """
+        storage_log.debug('Appending to %s in %s', name, self.path)
+        return _BlobWriter(self, name, replace=False)
+
+
+    def _store_blob(self, name, data, replace):
+        with self.lock, self.db:
+            if replace:
+                self.db.execute('DELETE FROM blobs WHERE name = ?', (name,))
+            if data or replace:
+                self.db.execute('INSERT INTO blobs (name, data) VALUES (?, ?)', (name, sqlite3.Binary(data)))
+
+
+    def load_state(self, name):
+        """
+        Returns the state saved for the bot called name. Raises IOError if
+        nothing has been saved yet.
+        """
+        with self.lock:
+            rows = self.db.execute('SELECT key, value FROM state WHERE bot = ?', (name,)).fetchall()
+            if not rows:
+                raise IOError('No state saved for {}'.format(name))
+
+            storage_log.debug('Loading state for %s from %s', name, self.path)
+
+            state = {}
+            for key, value in rows:
+                value = pickle.loads(bytes(value))
+
+                # the state table only holds an empty one of these; the
+                # contents are in their own table
+                if isinstance(value, FollowerIndex):
+                    self._load_users(name, key, value)
+                elif isinstance(value, TweetQueue):
+                    self._load_queue(name, key, value)
+                elif isinstance(value, SeenTweets):
+                    self._load_seen(name, key, value)
+                elif isinstance(value, PendingReplies):
+                    self._load_replies(name, key, value)
+
+                state[key] = value
+
+        return state
+
+
+    def save_state(self, name, state):
+        """
+        Save whatever changed in a BotState since the last save, in one
+        transaction.
+        """
+        changed, deleted = state.collect_changes()
+        if not changed and not deleted:
+            return
+
+        with self.lock:
+            saved = {}
+
+            with self.db:
+                for key, value in changed.items():
+                    if isinstance(value, FollowerIndex):
+                        saved[('users', key)] = self._save_users(name, key, value)
+                        value = FollowerIndex()
+                    elif isinstance(value, TweetQueue):
+                        saved[('queue', key)] = self._save_queue(name, key, value)
+                        value = value.empty_copy()
+                    elif isinstance(value, SeenTweets):
+                        saved[('seen', key)] = self._save_seen(name, key, value)
+                        value = SeenTweets(value.capacity)
+                    elif isinstance(value, PendingReplies):
+                        saved[('replies', key)] = self._save_replies(name, key, value)
+                        value = value.empty_copy()
+
+                    self.db.execute('INSERT OR REPLACE INTO state (bot, key, value) VALUES (?, ?, ?)',
+                            (name, key, sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))))
+
+                for key in deleted:
+                    self.db.execute('DELETE FROM state WHERE bot = ? AND key = ?', (name, key))
+                    for table, column in (('users', 'kind'), ('queue', 'key'), ('seen', 'key'), ('replies', 'key')):
+                        self.db.execute('DELETE FROM {} WHERE bot = ? AND {} = ?'.format(table, column), (name, key))
+                        saved[(table, key)] = {}
+
+            # only once the transaction has gone through
+            for (table, key), rows in saved.items():
+                self.saved[(table, name, key)] = rows
+
+        storage_log.debug('Saved %d changed keys for %s', len(changed) + len(deleted), name)
+
+
+    def _load_users(self, name, kind, index):
+        rows = self.db.execute('SELECT user_id, screen_name FROM users WHERE bot = ? AND kind = ?', (name, kind))
+
+        saved = {}
+        for user_id, screen_name in rows:
+            index.ids.add(user_id)
+            if screen_name is not None:
+                index.remember(user_id, screen_name)
+            saved[user_id] = screen_name
+
+        self.saved[('users', name, kind)] = saved
+
+
+    def _save_users(self, name, kind, index):
+        saved = self.saved.get(('users', name, kind), {})
+
+        # copied in one go, since actions may add to the index as we save
+        ids = set(index.ids)
+        screen_names = dict(index.screen_names)
+
+        current = dict((user_id, screen_names.get(user_id)) for user_id in ids)
+        removed = [(name, kind, user_id) for user_id in saved if user_id not in current]
+        upserted = [(name, kind, user_id, screen_name) for user_id, screen_name in current.items()
+                if user_id not in saved or saved[user_id] != screen_name]
+
+        self.db.executemany('DELETE FROM users WHERE bot = ? AND kind = ? AND user_id = ?', removed)
+        self.db.executemany('INSERT OR REPLACE INTO users (bot, kind, user_id, screen_name) VALUES (?, ?, ?, ?)', upserted)
+
+        return current
+
+
+    def _load_queue(self, name, key, queue):
+        rows = self.db.execute('SELECT tweet_id, tweet FROM queue WHERE bot = ? AND key = ? ORDER BY tweet_id', (name, key))
+
+        saved = {}
+        for tweet_id, tweet in rows:
+            queue.append(pickle.loads(bytes(tweet)))
+            saved[tweet_id] = None
+
+        self.saved[('queue', name, key)] = saved
+
+
+    def _save_queue(self, name, key, queue):
+        saved = self.saved.get(('queue', name, key), {})
+
+        tweets = dict((tweet.id, tweet) for tweet in list(queue))
+        removed = [(name, key, tweet_id) for tweet_id in saved if tweet_id not in tweets]
+        added = [(name, key, tweet_id, sqlite3.Binary(pickle.dumps(tweet, pickle.HIGHEST_PROTOCOL)))
+                for tweet_id, tweet in tweets.items() if tweet_id not in saved]
+
+        self.db.executemany('DELETE FROM queue WHERE bot = ? AND key = ? AND tweet_id = ?', removed)
+        self.db.executemany('INSERT OR REPLACE INTO queue (bot, key, tweet_id, tweet) VALUES (?, ?, ?, ?)', added)
+
+        return dict.fromkeys(tweets)
+
+
+    def _load_seen(self, name, key, seen):
+        rows = self.db.execute('SELECT tweet_id, seq FROM seen WHERE bot = ? AND key = ? ORDER BY seq', (name, key))
+
+        saved = {}
+        for tweet_id, seq in rows:
+            seen.add(tweet_id)
+            saved[tweet_id] = seq
+
+        self.saved[('seen', name, key)] = saved
+
+
+    def _save_seen(self, name, key, seen):
+        saved = self.saved.get(('seen', name, key), {})
+
+        ids = seen.__getstate__()['ids']
+        current = set(ids)
+        seq = max(saved.values()) + 1 if saved else 0
+
+        removed = [(name, key, tweet_id) for tweet_id in saved if tweet_id not in current]
+        added = []
+        rows = {}
+        for tweet_id in ids:
+            if tweet_id in saved:
+                rows[tweet_id] = saved[tweet_id]
+            else:
+                rows[tweet_id] = seq
+                added.append((name, key, tweet_id, seq))
+                seq += 1
+
+        self.db.executemany('DELETE FROM seen WHERE bot = ? AND key = ? AND tweet_id = ?', removed)
+        self.db.executemany('INSERT OR REPLACE INTO seen (bot, key, tweet_id, seq) VALUES (?, ?, ?, ?)', added)
+
+        return rows
+
+
+    def _load_replies(self, name, key, pending):
+        rows = self.db.execute('SELECT seq, reply FROM replies WHERE bot = ? AND key = ? ORDER BY seq', (name, key))
+
+        saved = {}
+        replies = []
+        for seq, reply in rows:
+            replies.append((seq,) + pickle.loads(bytes(reply)))
+            saved[seq] = None
+        pending.restore(replies)
+
+        self.saved[('replies', name, key)] = saved
+
+
+    def _save_replies(self, name, key, pending):
+        saved = self.saved.get(('replies', name, key), {})
+
+        replies = dict((reply[0], reply[1:]) for reply in pending.items())
+        removed = [(name, key, seq) for seq in saved if seq not in replies]
+        added = [(name, key, seq, sqlite3.Binary(pickle.dumps(reply, pickle.HIGHEST_PROTOCOL)))
+                for seq, reply in replies.items() if seq not in saved]
+
+        self.db.executemany('DELETE FROM replies WHERE bot = ? AND key = ? AND seq = ?', removed)
+        self.db.executemany('INSERT OR REPLACE INTO replies (bot, key, seq, reply) VALUES (?, ?, ?, ?)', added)
+
+        return dict.fromkeys(replies)
+
+
+class _BlobWriter(io.BytesIO):
+    """
+    Buffers data written to a SqliteStorage blob, storing it on close().
+    """
+
+    def __init__(self, storage, name, replace):
+        io.BytesIO.__init__(self)
+        self.storage = storage
+        self.name = name
+        self.replace = replace
+
+
+    def close(self):
+        if not self.closed:
+            self.storage._store_blob(self.name, self.getvalue(), self.replace)
+        io.BytesIO.close(self)
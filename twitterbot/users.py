@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*- #
+#
+# users.py
+# --------
+
+from __future__ import unicode_literals
+
+import threading
+import time
+
+from collections import OrderedDict
+
+from twitterbot.executor import Future
+
+
+# users/lookup takes at most this many ids per call
+LOOKUP_BATCH_SIZE = 100
+
+
+class UserCache(object):
+    """
+    Caches Twitter users by id, looking up the missing ones in batches.
+
+    lookup(ids) is called with up to batch_size ids at a time and should
+    return the users it found (tweepy's lookup_users does). Users are kept
+    for ttl seconds, and at most max_size of them, least recently used
+    first out. Ids that come back empty (suspended or deleted accounts) are
+    remembered too, so they aren't looked up again until the ttl is up.
+
+    If several threads ask for the same id at once, only one of them looks
+    it up; the others wait for its result, for up to wait_timeout seconds
+    (after which the id is left out).
+    """
+
+    def __init__(self, lookup, ttl=60 * 60, max_size=10000, batch_size=LOOKUP_BATCH_SIZE, clock=time.time,
+            wait_timeout=60):
+        self.lookup = lookup
+        self.ttl = ttl
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.clock = clock
+        self.wait_timeout = wait_timeout
+
+        self.users = OrderedDict()
+        self.pending = {}
+        self.lock = threading.Lock()
+
+
+    def __len__(self):
+        return len(self.users)
+
+
+    def get(self, ids):
+        """
+        Returns {id: user} for every id that belongs to an existing user.
+        Raises whatever lookup() raises if a lookup fails.
+        """
+        found = {}
+        waiting = []
+        missing = []
+
+        with self.lock:
+            now = self.clock()
+
+            for user_id in set(ids):
+                entry = self.users.get(user_id)
+                if entry is not None and entry[0] > now:
+                    del self.users[user_id]
+                    self.users[user_id] = entry
+                    if entry[1] is not None:
+                        found[user_id] = entry[1]
+                    continue
+
+                if user_id in self.pending:
+                    waiting.append((user_id, self.pending[user_id]))
+                else:
+                    self.pending[user_id] = Future()
+                    missing.append(user_id)
+
+        fetched = 0
+        try:
+            while fetched < len(missing):
+                batch = missing[fetched:fetched + self.batch_size]
+                fetched += len(batch)
+                found.update(self._fetch(batch))
+        except Exception as e:
+            # the batches after the one that failed were never looked up
+            self._fail(missing[fetched:], e)
+            raise
+
+        for user_id, future in waiting:
+            try:
+                user = future.result(self.wait_timeout)
+            except RuntimeError:
+                if future.done():
+                    raise
+                # timed out waiting for the other lookup
+                continue
+            if user is not None:
+                found[user_id] = user
+
+        return found
+
+
+    def _fetch(self, batch):
+        try:
+            users = dict((user.id, user) for user in self.lookup(batch))
+
+        except Exception as e:
+            self._fail(batch, e)
+            raise
+
+        with self.lock:
+            now = self.clock()
+            futures = []
+            for user_id in batch:
+                self._store(user_id, users.get(user_id), now)
+                futures.append((self.pending.pop(user_id), users.get(user_id)))
+
+        for future, user in futures:
+            future.set_result(user)
+
+        return users
+
+
+    def _fail(self, ids, e):
+        with self.lock:
+            futures = [self.pending.pop(user_id) for user_id in ids if user_id in self.pending]
+        for future in futures:
+            future.set_exception(e)
+
+
+    def _store(self, user_id, user, now):
+        self.users.pop(user_id, None)
+        self.users[user_id] = (now + self.ttl, user)
+
+        while len(self.users) > self.max_size:
+            self.users.popitem(last=False)